@@ -0,0 +1,175 @@
+import argparse
+import glob
+import json
+import os
+import queue
+import sys
+import tempfile
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+from typing import Iterable, Iterator
+
+from input_parser import InputParser, iter_puzzle_lines
+from solution_cache import SolutionCache
+from solver import ENGINES, SolverConfig, solve_puzzle
+
+# the path that reads puzzles from stdin
+STDIN = "-"
+
+# the solution cache opened by each worker process, if any
+_cache = None
+
+
+def find_puzzle_files(path: str) -> list[str]:
+    # a path may be a directory of puzzle files, a glob pattern, or a single file
+    if path == STDIN:
+        return [path]
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, x) for x in os.listdir(path)
+                      if x.endswith(".txt"))
+    if glob.has_magic(path):
+        return sorted(x for x in glob.glob(path, recursive=True)
+                      if os.path.isfile(x))
+    return [path]
+
+
+def iter_puzzles(paths: list[str]) -> Iterator[tuple[str, list[str]]]:
+    # lazily yield (source, lines) for every puzzle found in the given paths.
+    # Puzzles taken from a multi-puzzle file are labelled with their position in it
+    for path in paths:
+        for filename in find_puzzle_files(path):
+            if filename == STDIN:
+                yield from label_puzzles("<stdin>", sys.stdin)
+                continue
+            with open(filename, "r") as f:
+                yield from label_puzzles(filename, f)
+
+
+def label_puzzles(name: str, lines: Iterable[str]) -> Iterator[tuple[str, list[str]]]:
+    puzzles = iter_puzzle_lines(lines, name)
+    first = next(puzzles, None)
+    second = next(puzzles, None)
+    if first is None:
+        return
+    if second is None:
+        yield name, first
+        return
+    yield f"{name}#1", first
+    yield f"{name}#2", second
+    for n, puzzle_lines in enumerate(puzzles, start=3):
+        yield f"{name}#{n}", puzzle_lines
+
+
+def init_worker(engine: str, cache_path: str | None = None,
+                template_dir: str | None = None) -> None:
+    # pay for importing mip, loading the CBC library and building the base
+    # model template once per worker process rather than once per puzzle. The
+    # template is written to template_dir, which the parent removes once the
+    # pool has shut down. The dlx engine hands some puzzles on to mip, so its
+    # workers need the template too
+    global _cache
+    if engine in ("mip", "dlx"):
+        from sudoku_model import base_model_path
+        base_model_path(template_dir)
+    if cache_path is not None:
+        _cache = SolutionCache(cache_path)
+
+
+def solve_task(task: tuple[str, list[str]], engine: str = "mip",
+               config: SolverConfig | None = None) -> dict[str, str | None]:
+    source, lines = task
+    try:
+        solution = solve_puzzle(InputParser(source, lines).parse_puzzle(), engine, _cache, config)
+    except (ValueError, TimeoutError) as e:
+        return {"source": source, "solution": None, "error": str(e)}
+
+    if solution is None:
+        return {"source": source, "solution": None, "error": "no solution found"}
+    return {"source": source, "solution": solution, "error": None}
+
+
+def solve_chunk(tasks: list[tuple[str, list[str]]], engine: str = "mip",
+                config: SolverConfig | None = None) -> list[dict[str, str | None]]:
+    return [solve_task(task, engine, config) for task in tasks]
+
+
+def solve_batch(paths: list[str], workers: int | None = None, chunksize: int = 1,
+                engine: str = "mip", cache_path: str | None = None,
+                config: SolverConfig | None = None) -> Iterator[dict[str, str | None]]:
+    # results are yielded as soon as each puzzle is solved, so they do not
+    # come back in the same order as the input. Puzzles are only read as
+    # workers become free, so memory use does not grow with the input
+    with tempfile.TemporaryDirectory(prefix="sudoku_") as template_dir, \
+            Pool(workers, initializer=init_worker,
+                 initargs=(engine, cache_path, template_dir)) as pool:
+        # a few chunks are kept queued per worker so that none sit idle
+        max_pending = 4 * (workers or os.cpu_count() or 1)
+        finished = queue.Queue()
+        pending = 0
+        tasks = iter_puzzles(paths)
+
+        while True:
+            chunk = list(islice(tasks, chunksize))
+            if chunk:
+                pool.apply_async(partial(solve_chunk, engine=engine, config=config), (chunk,),
+                                 callback=finished.put, error_callback=finished.put)
+                pending += 1
+            if pending and (pending >= max_pending or not chunk):
+                results = finished.get()
+                pending -= 1
+                if isinstance(results, BaseException):
+                    raise results
+                yield from results
+            if not chunk and not pending:
+                return
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(
+        description="Solve many puzzles across a pool of worker processes")
+    arg_parser.add_argument(
+        "paths", nargs="+",
+        help="puzzle files, directories of puzzle files or glob patterns, "
+             "or - to read puzzles from stdin")
+    arg_parser.add_argument(
+        "-j", "--workers", type=int, default=None,
+        help="number of worker processes (default: number of CPUs)")
+    arg_parser.add_argument(
+        "--chunksize", type=int, default=1,
+        help="number of puzzles handed to a worker at a time")
+    arg_parser.add_argument(
+        "--engine", choices=ENGINES, default="mip",
+        help="solving engine to use (default: mip)")
+    arg_parser.add_argument(
+        "--time-limit", type=float, metavar="SECONDS",
+        help="give up on a puzzle after this many seconds of searching")
+    arg_parser.add_argument(
+        "--cache", metavar="PATH",
+        help="reuse solutions stored in this sqlite file, and store new ones in it")
+    arg_parser.add_argument(
+        "--json", action="store_true",
+        help="write one JSON object per puzzle instead of tab separated text")
+    args = arg_parser.parse_args(argv)
+
+    failed = 0
+    config = SolverConfig(time_limit=args.time_limit)
+    try:
+        for result in solve_batch(args.paths, args.workers, args.chunksize,
+                                  args.engine, args.cache, config):
+            if result["error"] is not None:
+                failed += 1
+            if args.json:
+                print(json.dumps(result), flush=True)
+            else:
+                print(f"{result['source']}\t{result['solution'] or result['error']}",
+                      flush=True)
+    except ValueError as e:
+        # a malformed line stops the batch, as the puzzles around it can't be
+        # told apart reliably
+        sys.exit(str(e))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
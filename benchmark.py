@@ -0,0 +1,343 @@
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from batch import iter_puzzles
+from dlx_solver import is_exact_cover
+from grid import BOX_SHAPES
+from input_parser import InputParser
+from puzzle import Puzzle
+from solver import ENGINES
+
+PUZZLE_DIR = "puzzles"
+
+# main.py, run in a fresh interpreter to time how long the CLI takes to start
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+STARTUP_PUZZLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), PUZZLE_DIR, "classic.txt")
+
+# a puzzle only counts as regressed if it slowed down by at least this many
+# seconds, so that tiny puzzles are not failed by timer noise
+MIN_REGRESSION_SECONDS = 0.002
+
+# the settings a run's times depend on, with the values baselines written
+# before they were recorded were run with. Runs are only compared when these match
+RUN_SETTINGS = {"engine": "mip", "strengthen": False, "cold_start": False}
+
+
+def time_puzzle(source: str, lines: list[str], engine: str, strengthen: bool = False,
+                cold_start: bool = False) -> dict:
+    # time one run through every phase of solving a puzzle
+    timings = {}
+
+    start = time.perf_counter()
+    puzzle = InputParser(source, lines).parse_puzzle()
+    timings["parse"] = time.perf_counter() - start
+
+    if engine == "dlx" and not is_exact_cover(puzzle):
+        # timed as solve_puzzle would solve it
+        engine = "mip"
+
+    start = time.perf_counter()
+    if engine == "dlx":
+        from dlx_solver import DancingLinksSolver
+        model = DancingLinksSolver(puzzle)
+        timings["build_base"] = time.perf_counter() - start
+        breakdown = {}
+    elif engine == "mip":
+        from solver import SolverConfig, warm_start
+        from sudoku_model import SudokuModel
+        # the propagation pass solve_puzzle runs before building the model
+        known = warm_start(puzzle, SolverConfig(warm_start=not cold_start))
+        breakdown = {"propagation": time.perf_counter() - start}
+        if known is not None and all(len(digits) == 1 for digits in known):
+            # it placed every cell, so solve_puzzle would not build a model
+            model = None
+            timings["build_base"] = time.perf_counter() - start
+        else:
+            model = SudokuModel(puzzle)
+            timings["build_base"] = time.perf_counter() - start
+            # the model records what each family of constraints costs as it is added
+            model.add_constraints(strengthen, known)
+            breakdown.update((family, stats.seconds)
+                             for family, stats in model.stats.families.items())
+    else:
+        from propagation_solver import PropagationSolver
+        model = PropagationSolver(puzzle)
+        timings["build_base"] = time.perf_counter() - start
+        breakdown = {}
+        step = time.perf_counter()
+        model.add_standard_constraints()
+        breakdown["standard"] = time.perf_counter() - step
+        for family in model.constraint_families:
+            step = time.perf_counter()
+            getattr(model, f"add_{family}_constraints")()
+            breakdown[family] = time.perf_counter() - step
+    timings["build"] = time.perf_counter() - start
+    timings["build_breakdown"] = breakdown
+
+    start = time.perf_counter()
+    if engine == "mip" and model is None:
+        solution = "".join(str(min(digits)) for digits in known)
+        timings["solve"] = time.perf_counter() - start
+        timings["extract"] = 0.0
+        counts = {"rows": 0, "cols": 0, "nonzeros": 0, "nodes": 0, "iterations": 0,
+                  "family_sizes": {}}
+    elif engine == "mip":
+        model.verbose = False
+        model.optimize()
+        timings["solve"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        solution = model.solution_string() or None
+        timings["extract"] = time.perf_counter() - start
+        counts = {"rows": model.num_rows, "cols": model.num_cols, "nonzeros": model.num_nz,
+                  "nodes": model.stats.nodes, "iterations": model.stats.iterations,
+                  "family_sizes": {family: {"rows": stats.rows, "nonzeros": stats.nonzeros}
+                                   for family, stats in model.stats.families.items()
+                                   if stats.rows or stats.nonzeros}}
+    elif engine == "dlx":
+        solution = model.solve()
+        timings["solve"] = time.perf_counter() - start
+        timings["extract"] = 0.0
+        counts = {"options": len(model.rows), "columns": len(model.columns)}
+    else:
+        solution = model.solve()
+        timings["solve"] = time.perf_counter() - start
+        timings["extract"] = 0.0
+        counts = {"propagators": len(model.propagators)}
+
+    timings["total"] = (timings["parse"] + timings["build"]
+                        + timings["solve"] + timings["extract"])
+    return {**counts, **timings, "solution": solution}
+
+
+def benchmark_puzzle(source: str, lines: list[str], engine: str, repeat: int,
+                     strengthen: bool = False, cold_start: bool = False) -> dict:
+    # run a puzzle repeat times, reporting the median time of each phase
+    runs = [time_puzzle(source, lines, engine, strengthen, cold_start) for _ in range(repeat)]
+    result = {key: value for key, value in runs[0].items()
+              if not isinstance(value, float) and key != "build_breakdown"}
+    for key, value in runs[0].items():
+        if isinstance(value, float):
+            result[key] = statistics.median(run[key] for run in runs)
+    result["build_breakdown"] = {
+        family: statistics.median(run["build_breakdown"][family] for run in runs)
+        for family in runs[0]["build_breakdown"]}
+    result["total_min"] = min(run["total"] for run in runs)
+    return result
+
+
+def measure_startup(engine: str, repeat: int) -> dict:
+    # time complete runs of main.py in a fresh interpreter, once only parsing a
+    # puzzle and once solving it, as short CLI calls spend most of their time on
+    # imports. Noise only ever makes a run slower, so the fastest run is kept
+    timings = {}
+    for phase, args in [("cli_parse_only", ["--parse-only"]), ("cli_solve", [])]:
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, MAIN, STARTUP_PUZZLE, "--engine", engine, *args],
+                           stdout=subprocess.DEVNULL, check=True)
+            runs.append(time.perf_counter() - start)
+        timings[phase] = min(runs)
+    return timings
+
+
+def benchmark_parsing(puzzles: list[tuple[str, list[str]]], count: int) -> dict:
+    # parse count puzzles, cycling through the corpus, and report the throughput.
+    # Only parsing is timed, so this is quick enough to run over large puzzle sets
+    start = time.perf_counter()
+    for n in range(count):
+        source, lines = puzzles[n % len(puzzles)]
+        InputParser(source, lines).parse_puzzle()
+    elapsed = time.perf_counter() - start
+    return {"puzzles": count, "seconds": elapsed, "per_second": count / elapsed}
+
+
+def scaling_puzzle(size: int, blank: float, seed: int = 0) -> Puzzle:
+    # a size x size puzzle with the given fraction of its cells left blank, made
+    # from a filled grid where each row is the one above shifted by a box width,
+    # and each band by one more. Its digits are shuffled so the solver can't
+    # rely on the pattern
+    box_rows, box_cols = BOX_SHAPES[size]
+    rng = random.Random(seed)
+    digits = rng.sample(range(1, size + 1), size)
+    givens = [digits[(box_cols * (i % box_rows) + i // box_rows + j) % size]
+              for i in range(size) for j in range(size)]
+    for c in rng.sample(range(size * size), round(blank * size * size)):
+        givens[c] = 0
+    return Puzzle(givens=tuple(givens), size=size)
+
+
+def benchmark_scaling(repeat: int, blank: float) -> dict:
+    # how building and solving a classic puzzle grows with the grid size. Each
+    # size is solved repeat times, reporting the median of each phase
+    from sudoku_model import SudokuModel
+
+    results = {}
+    for size in BOX_SHAPES:
+        puzzle = scaling_puzzle(size, blank)
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            model = SudokuModel(puzzle)
+            model.add_constraints()
+            built = time.perf_counter()
+            model.verbose = False
+            model.optimize()
+            solved = time.perf_counter()
+            if not model.solution_string():
+                raise RuntimeError(f"No solution found for the {size}x{size} puzzle")
+            runs.append((built - start, solved - built))
+        results[size] = {"variables": model.num_cols, "rows": model.num_rows,
+                         "nonzeros": model.num_nz,
+                         "build": statistics.median(run[0] for run in runs),
+                         "solve": statistics.median(run[1] for run in runs)}
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    # describe every puzzle whose median total time is more than threshold
+    # (a fraction) slower than in the baseline
+    for setting, default in RUN_SETTINGS.items():
+        before = baseline.get(setting, default)
+        after = results.get(setting, default)
+        if before != after:
+            raise ValueError(f"The baseline was run with {setting} {before}, "
+                             f"not {after}, so its times can't be compared")
+    regressions = []
+    for source, result in results["puzzles"].items():
+        if source not in baseline["puzzles"]:
+            continue
+        before = baseline["puzzles"][source]["total"]
+        after = result["total"]
+        if after > before * (1 + threshold) and after - before > MIN_REGRESSION_SECONDS:
+            regressions.append(
+                f"{source}: {before * 1000:.2f}ms -> {after * 1000:.2f}ms "
+                f"(+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(
+        description="Time each phase of solving every puzzle in a corpus")
+    arg_parser.add_argument(
+        "paths", nargs="*",
+        help=f"puzzle files, directories or glob patterns (default: {PUZZLE_DIR}/)")
+    arg_parser.add_argument(
+        "-n", "--repeat", type=int, default=3,
+        help="number of times to solve each puzzle (default: 3)")
+    arg_parser.add_argument(
+        "--engine", choices=ENGINES, default="mip",
+        help="solving engine to benchmark (default: mip)")
+    arg_parser.add_argument(
+        "--strengthen", action="store_true",
+        help="add redundant constraints and symmetry breaks to the mip model")
+    arg_parser.add_argument(
+        "--cold-start", action="store_true",
+        help="build the mip model without running the propagation pass first")
+    arg_parser.add_argument(
+        "-o", "--output", help="write the results as JSON to this file")
+    arg_parser.add_argument(
+        "--baseline", help="JSON results of an earlier run to compare against")
+    arg_parser.add_argument(
+        "--threshold", type=float, default=0.2,
+        help="fail when a puzzle is this fraction slower than the baseline (default: 0.2)")
+    arg_parser.add_argument(
+        "--family-sizes", action="store_true",
+        help="also print the rows and nonzeros each constraint family adds to the mip model")
+    arg_parser.add_argument(
+        "--parse-only", type=int, metavar="COUNT",
+        help="only time parsing COUNT puzzles, cycling through the corpus")
+    arg_parser.add_argument(
+        "--scaling", type=float, metavar="BLANK",
+        help="only time the mip engine on a classic puzzle of each grid size, "
+             "with this fraction of the cells blank")
+    args = arg_parser.parse_args(argv)
+
+    if args.parse_only:
+        puzzles = list(iter_puzzles(args.paths or [PUZZLE_DIR]))
+        result = benchmark_parsing(puzzles, args.parse_only)
+        print(f"Parsed {result['puzzles']} puzzles in {result['seconds']:.3f}s "
+              f"({result['per_second']:.0f} puzzles/s)")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(result, f, indent=2)
+        return 0
+
+    if args.scaling is not None:
+        results = benchmark_scaling(args.repeat, args.scaling)
+        print(f"{'size':<8}{'variables':>10}{'rows':>8}{'nonzeros':>10}{'build':>10}{'solve':>10}"
+              f"  (ms, median of {args.repeat})")
+        for size, result in results.items():
+            print(f"{f'{size}x{size}':<8}{result['variables']:>10}{result['rows']:>8}"
+                  f"{result['nonzeros']:>10}{result['build'] * 1000:>10.2f}"
+                  f"{result['solve'] * 1000:>10.2f}")
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        return 0
+
+    results = {
+        "engine": args.engine,
+        "repeat": args.repeat,
+        "strengthen": args.strengthen,
+        "cold_start": args.cold_start,
+        "python": platform.python_version(),
+        "puzzles": {},
+    }
+
+    results["startup"] = measure_startup(args.engine, args.repeat)
+    if args.engine in ("mip", "dlx"):
+        # load the CBC library and build the base model before timing anything
+        start = time.perf_counter()
+        from sudoku_model import base_model_path
+        base_model_path()
+        results["startup"]["load_mip"] = time.perf_counter() - start
+    print("startup: " + ", ".join(f"{phase} {seconds * 1000:.1f}ms"
+                                  for phase, seconds in results["startup"].items()) + "\n")
+
+    print(f"{'puzzle':<32}{'parse':>9}{'build':>9}{'solve':>10}{'extract':>9}"
+          f"{'total':>10}  (ms, median of {args.repeat})")
+    for source, lines in iter_puzzles(args.paths or [PUZZLE_DIR]):
+        result = benchmark_puzzle(source, lines, args.engine, args.repeat, args.strengthen,
+                                  args.cold_start)
+        results["puzzles"][source] = result
+        print(f"{source:<32}" + "".join(
+            f"{result[phase] * 1000:>{width}.2f}" for phase, width in
+            [("parse", 9), ("build", 9), ("solve", 10), ("extract", 9), ("total", 10)]))
+        if args.family_sizes and "family_sizes" in result:
+            print(f"{'':<4}{result['rows']} rows, {result['nonzeros']} nonzeros, "
+                  f"{result['nodes']} nodes; rows/nonzeros by family: " + ", ".join(
+                      f"{family} {sizes['rows']}/{sizes['nonzeros']}"
+                      for family, sizes in result["family_sizes"].items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(results, baseline, args.threshold)
+        except ValueError as e:
+            sys.exit(str(e))
+        if regressions:
+            print(f"\n{len(regressions)} puzzle(s) regressed by more than "
+                  f"{args.threshold * 100:.0f}%:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"\nNo puzzle regressed by more than {args.threshold * 100:.0f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+from itertools import combinations
+
+# every set of distinct digits 1-9 by its (size, total), which both engines use
+# to restrict killer cages and arrows. There are only 512 sets, so the table is
+# built once on import. Building it takes well under a millisecond, which is
+# less than reading it back from a file would
+SUM_COMBINATIONS: dict[tuple[int, int], tuple[frozenset[int], ...]] = {}
+for size in range(1, 10):
+    for digits in combinations(range(1, 10), size):
+        key = (size, sum(digits))
+        SUM_COMBINATIONS[key] = SUM_COMBINATIONS.get(key, ()) + (frozenset(digits),)
+del size, digits, key
+
+
+def sum_combinations(size: int, total: int) -> tuple[frozenset[int], ...]:
+    # every set of size distinct digits that sums to total
+    return SUM_COMBINATIONS.get((size, total), ())
+
+
+def can_fill(candidates: list[set[int]], digits: frozenset[int]) -> bool:
+    # whether each cell can take a different one of digits, where candidates
+    # holds the digits still possible in each cell
+    reachable = {frozenset()}
+    for cell in candidates:
+        reachable = {used | {d} for used in reachable for d in cell & digits if d not in used}
+        if not reachable:
+            return False
+    return True
@@ -0,0 +1,147 @@
+from dataclasses import fields
+from itertools import islice
+from typing import Iterator
+
+from grid import SYMBOLS, get_grid
+from puzzle import Puzzle
+
+
+def is_exact_cover(puzzle: Puzzle) -> bool:
+    # whether every rule the puzzle uses is a region that holds each digit at
+    # most once, or exactly once when it has a cell for every digit. Those are
+    # the houses, diagonals, extra regions and killer cages without a total
+    for f in fields(Puzzle):
+        value = getattr(puzzle, f.name)
+        if f.name in ("givens", "size", "diagonal", "extra_regions") or not value:
+            continue
+        if f.name == "killer" and all(cage.total == 0 for cage in value):
+            continue
+        return False
+    return True
+
+
+class DancingLinksSolver:
+    # the puzzle as an exact cover problem, solved with Knuth's Algorithm X.
+    # Each option places one digit in one cell, and covers that cell's column
+    # and the column of the digit in every region holding the cell. Regions
+    # with a cell for every digit must be covered exactly once, while smaller
+    # ones, such as cages, may be covered at most once, so are never branched
+    # on. The links are dicts of sets rather than linked lists, which is much
+    # quicker in Python and undoes a choice the same way
+    #
+    # Column j is primary when j < self.primary, and option c * size + k places
+    # the digit k + 1 in cell c
+
+    def __init__(self, puzzle: Puzzle) -> None:
+        if not is_exact_cover(puzzle):
+            raise ValueError("The puzzle uses rules that are not an exact cover, "
+                             "use the mip or propagation engine")
+        self.puzzle = puzzle
+        self.grid = get_grid(puzzle.size)
+
+        n = self.grid.size
+        regions = list(self.grid.houses)
+        if puzzle.diagonal:
+            regions += self.grid.diagonals
+        regions += puzzle.extra_regions
+        regions += [cage.cells for cage in puzzle.killer]
+        # full regions first, so their columns follow the cell columns among
+        # the primary columns
+        regions.sort(key=lambda region: len(region) != n)
+        self.primary = self.grid.cells + n * sum(len(region) == n for region in regions)
+
+        # the region columns of each cell, for its first digit. The columns
+        # for digit k are k further on
+        region_columns = [[] for _ in range(self.grid.cells)]
+        for r, region in enumerate(regions):
+            for c in region:
+                region_columns[c].append(self.grid.cells + r * n)
+
+        # the givens are placed before the search. The columns they cover are
+        # left out, along with every option that would cover one of them again,
+        # which leaves far fewer options to link up
+        self.placed = []
+        covered = set()
+        self.contradiction = False
+        for c, given in enumerate(puzzle.givens):
+            if given:
+                row = [c] + [j + given - 1 for j in region_columns[c]]
+                self.contradiction |= not covered.isdisjoint(row)
+                covered.update(row)
+                self.placed.append(c * n + given - 1)
+
+        # rows[option] is the columns the option covers, and columns[j] is the
+        # options still able to cover column j
+        self.rows = {}
+        for c, given in enumerate(puzzle.givens):
+            if not given:
+                for k in range(n):
+                    row = [c] + [j + k for j in region_columns[c]]
+                    if covered.isdisjoint(row):
+                        self.rows[c * n + k] = row
+        self.columns = {j: set() for j in range(self.grid.cells + len(regions) * n)
+                        if j not in covered}
+        for option, row in self.rows.items():
+            for j in row:
+                self.columns[j].add(option)
+
+    def select(self, option: int) -> list[set[int]]:
+        # choose option, removing every column it covers and every other option
+        # that covers one of them. Returns the removed columns for deselect
+        columns, rows = self.columns, self.rows
+        removed = []
+        for j in rows[option]:
+            for other in columns[j]:
+                for k in rows[other]:
+                    if k != j:
+                        columns[k].discard(other)
+            removed.append(columns.pop(j))
+        return removed
+
+    def deselect(self, option: int, removed: list[set[int]]) -> None:
+        columns, rows = self.columns, self.rows
+        for j in reversed(rows[option]):
+            columns[j] = removed.pop()
+            for other in columns[j]:
+                for k in rows[other]:
+                    if k != j:
+                        columns[k].add(other)
+
+    def search(self, chosen: list[int]) -> Iterator[list[int]]:
+        # depth first, branching on the primary column with the fewest options
+        # left. Every chosen list yielded covers each primary column once
+        columns, primary = self.columns, self.primary
+        best = None
+        for j, options in columns.items():
+            if j < primary and (best is None or len(options) < len(columns[best])):
+                best = j
+                if len(options) <= 1:
+                    break
+        if best is None:
+            yield chosen
+            return
+
+        for option in list(columns[best]):
+            removed = self.select(option)
+            chosen.append(option)
+            # undone even when the caller stops early, so the solver can search again
+            try:
+                yield from self.search(chosen)
+            finally:
+                chosen.pop()
+                self.deselect(option, removed)
+
+    def solutions(self) -> Iterator[str]:
+        if self.contradiction:
+            return
+        n = self.grid.size
+        for solved in self.search(list(self.placed)):
+            yield "".join(SYMBOLS[option % n] for option in sorted(solved))
+
+    def solve(self) -> str | None:
+        # return the first solution found as a string of one symbol per cell
+        return next(self.solutions(), None)
+
+    def count_solutions(self, limit: int = 2) -> int:
+        # the search stops as soon as limit solutions have been found
+        return sum(1 for _ in islice(self.solutions(), limit))
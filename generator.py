@@ -0,0 +1,169 @@
+import argparse
+import random
+import sys
+import time
+from dataclasses import replace
+
+from mip import OptimizationStatus
+
+from input_parser import GIVENS_ROW, InputParser
+from propagation_solver import DIGIT_BITS, PropagationSolver, SearchLimit
+from puzzle import Puzzle
+from session import SolveSession
+
+
+# the branches the propagation engine may search for another solution before a
+# check is handed to the mip model instead. On the sample grids no check needs
+# this many, and the hardest take a few thousand
+SEARCH_NODES = 10000
+
+
+class PuzzleGenerator:
+    # makes puzzles from a filled grid and a set of clues by removing givens one
+    # at a time, keeping each removal only while the solution stays unique. One
+    # model is built for the grid and clues and kept for every puzzle made from
+    # them, with the givens switched through variable bounds.
+    #
+    # Each check solves with a no-good cut against the filled grid. As the
+    # puzzle was unique before the given in a cell was removed, any other
+    # solution must differ from the grid in that cell, so the cut reduces to
+    # the bound x[cell][digit] <= 0 and no row is added or removed. Most checks
+    # are settled before that by the propagation engine, which searches for
+    # another solution with the grid's digit ruled out of the cell, and the
+    # model is only solved when that search runs past SEARCH_NODES
+
+    def __init__(self, puzzle: Puzzle, time_limit: float | None = None) -> None:
+        # puzzle holds the filled grid as its givens, along with its clues
+        if puzzle.size != 9 or not all(puzzle.givens):
+            raise ValueError("The generator needs a completely filled 9x9 grid")
+        self.solution = puzzle.givens
+        self.time_limit = time_limit
+        self.session = SolveSession(puzzle)
+        # the grid has to satisfy the clues for any removal to be checked against it
+        if self.session.solve() is None:
+            raise ValueError("The filled grid breaks the puzzle's clues")
+        # the propagation engine's constraints for the clues alone, which the
+        # givens narrow for each check
+        self.propagator = PropagationSolver(replace(puzzle, givens=(0,) * 81))
+        self.propagator.add_constraints()
+        self.checks = 0
+        self.solves = 0
+
+    def still_unique(self, cell: int) -> bool:
+        # whether the grid is still the only solution with the given in cell removed
+        session = self.session
+        session.update_bounds()
+        self.checks += 1
+        variable = session.model.cells[cell][self.solution[cell] - 1]
+        # the remaining givens place the cell themselves, so nothing has changed
+        if session.lower[variable.idx]:
+            return True
+        cands = self.propagated(cell)
+        if cands is None:
+            return True
+        try:
+            return self.search(cands, SEARCH_NODES)
+        except SearchLimit:
+            pass
+
+        self.solves += 1
+        variable.ub = 0
+        status = session.model.optimize(max_seconds=self.time_limit or float("inf"))
+        variable.ub = session.upper[variable.idx]
+        # CBC reports INT_INFEASIBLE when only the relaxation has a solution
+        if status in (OptimizationStatus.INFEASIBLE, OptimizationStatus.INT_INFEASIBLE):
+            return True
+        # a check that runs out of time counts as not unique, so the given stays
+        if status in (OptimizationStatus.OPTIMAL, OptimizationStatus.FEASIBLE,
+                      OptimizationStatus.NO_SOLUTION_FOUND):
+            return False
+        # CBC failed without an answer, so the propagation engine searches instead
+        return self.search(cands)
+
+    def search(self, cands: list[int], node_limit: int | None = None) -> bool:
+        # whether the propagation engine finds no solution from cands, raising
+        # SearchLimit if it searches more than node_limit branches first
+        propagator = self.propagator
+        propagator.nodes = 0
+        propagator.node_limit = node_limit
+        return next(propagator.search(cands), None) is None
+
+    def propagated(self, cell: int) -> list[int] | None:
+        # the propagation engine's candidates with the current givens and the
+        # grid's digit ruled out of cell, or None when that contradicts the clues,
+        # leaving the grid as the only solution
+        cands = self.propagator.candidates.copy()
+        for c, d in enumerate(self.session.puzzle.givens):
+            if d:
+                cands[c] &= DIGIT_BITS[d - 1]
+        cands[cell] &= ~DIGIT_BITS[self.solution[cell] - 1]
+        return self.propagator.propagate_all(cands)
+
+    def generate(self, seed: int | None = None, min_givens: int = 0) -> Puzzle:
+        # a puzzle with a unique solution and no given that can be removed
+        # without losing that, or with min_givens givens, trying cells in an
+        # order set by seed
+        session = self.session
+        for c, d in enumerate(self.solution):
+            session.set_given(c, d)
+        givens = 81
+        for c in random.Random(seed).sample(range(81), 81):
+            if givens <= min_givens:
+                break
+            session.set_given(c, 0)
+            if self.still_unique(c):
+                givens -= 1
+            else:
+                session.set_given(c, self.solution[c])
+        return session.puzzle
+
+
+def puzzle_text(puzzle: Puzzle, clue_lines: list[str]) -> str:
+    # the puzzle in the form InputParser reads, with the clue lines it was made from
+    rows = ["".join(str(d) if d else "." for d in puzzle.givens[i * 9:(i + 1) * 9])
+            for i in range(9)]
+    return "\n".join(rows + clue_lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(
+        description="Make puzzles from a filled grid and its clues by removing givens")
+    arg_parser.add_argument(
+        "filepath",
+        help="puzzle file whose grid is completely filled, along with any clues and rules")
+    arg_parser.add_argument(
+        "-n", "--count", type=int, default=1,
+        help="number of puzzles to make (default: 1)")
+    arg_parser.add_argument(
+        "--seed", type=int, default=0,
+        help="seed for the order givens are removed in; puzzle i uses seed + i (default: 0)")
+    arg_parser.add_argument(
+        "--min-givens", type=int, default=0,
+        help="stop removing givens once this many are left (default: 0)")
+    arg_parser.add_argument(
+        "--time-limit", type=float, metavar="SECONDS",
+        help="keep a given whose removal takes longer than this to check")
+    args = arg_parser.parse_args(argv)
+
+    parser = InputParser(args.filepath)
+    try:
+        lines = parser.read_file()
+        generator = PuzzleGenerator(parser.parse_puzzle(), args.time_limit)
+    except ValueError as e:
+        sys.exit(str(e))
+    clue_lines = [line for line in lines if not GIVENS_ROW.match(line)]
+
+    start = time.perf_counter()
+    for i in range(args.count):
+        if i:
+            print("---")
+        puzzle = generator.generate(args.seed + i, args.min_givens)
+        print(puzzle_text(puzzle, clue_lines), flush=True)
+    elapsed = time.perf_counter() - start
+    print(f"Made {args.count} puzzles in {elapsed:.2f}s ({args.count / elapsed * 60:.0f} per minute), "
+          f"{generator.solves} of {generator.checks} checks needed a solve", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+from functools import lru_cache
+
+# the (rows, columns) of a box for each supported grid size. Boxes are as close
+# to square as the size allows, and are laid out wider than they are tall
+BOX_SHAPES = {
+    4: (2, 2),
+    6: (2, 3),
+    9: (3, 3),
+    12: (3, 4),
+    16: (4, 4),
+    25: (5, 5),
+}
+
+# the symbol written for each digit, so that digit d is SYMBOLS[d - 1]. Grids
+# larger than 9x9 carry on from 9 with letters, so 16x16 grids use 1-9 and a-g
+SYMBOLS = "123456789abcdefghijklmnop"
+
+
+class Grid:
+    # the layout of a size x size grid: its houses and the pairs of cells that
+    # neighbour each other, as lists of cell indices. Cells are numbered row by
+    # row from 0, so cell (i, j) is i * size + j
+
+    def __init__(self, size: int) -> None:
+        if size not in BOX_SHAPES:
+            raise ValueError(f"Unsupported grid size {size}, expected one of "
+                             + ", ".join(map(str, BOX_SHAPES)))
+        n = self.size = size
+        self.box_rows, self.box_cols = BOX_SHAPES[size]
+        self.cells = n * n
+
+        self.rows = [[i * n + j for j in range(n)] for i in range(n)]
+        self.columns = [[i * n + j for i in range(n)] for j in range(n)]
+        self.boxes = [[i * n + j
+                       for i in range(i2, i2 + self.box_rows)
+                       for j in range(j2, j2 + self.box_cols)]
+                      for i2 in range(0, n, self.box_rows)
+                      for j2 in range(0, n, self.box_cols)]
+        self.houses = self.rows + self.columns + self.boxes
+        self.diagonals = [[i * (n + 1) for i in range(n)],
+                          [(i + 1) * (n - 1) for i in range(n)]]
+
+        # each pair of neighbouring cells appears once. Orthogonally adjacent
+        # cells are left out of king_pairs as they are already ruled out by
+        # normal sudoku rules
+        self.orthogonal_pairs = self.offset_pairs([(0, 1), (1, 0)])
+        self.king_pairs = self.offset_pairs([(1, -1), (1, 1)])
+        self.knight_pairs = self.offset_pairs([(1, -2), (1, 2), (2, -1), (2, 1)])
+
+    def offset_pairs(self, offsets: list[tuple[int, int]]) -> tuple[tuple[int, int], ...]:
+        # every pair of cells (a, b) where b is one of the (row, col) offsets from a
+        n = self.size
+        return tuple((i * n + j, (i + di) * n + j + dj)
+                     for i in range(n) for j in range(n) for di, dj in offsets
+                     if 0 <= i + di < n and 0 <= j + dj < n)
+
+    def box_of(self, c: int) -> int:
+        i, j = divmod(c, self.size)
+        return i // self.box_rows * (self.size // self.box_cols) + j // self.box_cols
+
+    def share_house(self, a: int, b: int) -> bool:
+        # whether cells a and b are in the same row, column or box
+        n = self.size
+        return a // n == b // n or a % n == b % n or self.box_of(a) == self.box_of(b)
+
+
+@lru_cache(maxsize=None)
+def get_grid(size: int) -> Grid:
+    # grids hold nothing specific to a puzzle, so one of each size is shared
+    return Grid(size)
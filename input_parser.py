@@ -1,150 +1,181 @@
 import re
+from typing import Iterable, Iterator
+
+from grid import BOX_SHAPES
+from puzzle import Puzzle
+
+# a line made of 3 or more dashes separates puzzles in a multi-puzzle file
+PUZZLE_SEPARATOR = re.compile(r"^-{3,}$")
+
+# a whole classic puzzle on one line, as used by most puzzle datasets. Either
+# "." or "0" marks an empty cell, and anything after the grid (such as the
+# solution column of a CSV file) is ignored
+ONE_LINE_PUZZLE = re.compile(r"^([\d\.]{81})(?:[\s,;|].*)?$")
+
+GIVENS_ROW = re.compile(r"^[\d\.]{9}$")
+
+# the cells at the start of a line, ending where a one-line puzzle's grid would.
+# A line with more of them than the longest grid row is a one-line puzzle, and
+# one that is not 81 cells long is reported rather than skipped
+LEADING_CELLS = re.compile(r"^([\d\.]+)(?:[\s,;|].*)?$")
+LONGEST_ROW = max(BOX_SHAPES)
+
+# grids other than 9x9 declare their size on a line such as "size: 16"
+SIZE_LINE = re.compile(r"^size:?\s*(\d+)$", re.IGNORECASE)
+
+
+def sized_row(size: int) -> re.Pattern:
+    # a row of a size x size grid, either one symbol per cell (see grid.SYMBOLS)
+    # or the digits of its cells as numbers separated by spaces, such as
+    # "12 . 3 16 ..." for a 16x16 grid
+    return re.compile(rf"^(?:[\da-z\.]{{{size}}}|[\d\.]+(?:\s+[\d\.]+){{{size - 1}}})$")
+
+# the pattern of a line for each kind of clue. No line can match more than one
+# of them, so they are combined into a single pattern and each line is matched
+# once, with the name of the group that matched giving its kind
+CLUE_PATTERNS = {
+    "givens": r"[\d\.]{9}",
+    "arrow": r"\d{4,}a",
+    "clone": r"\d{2,}clone\d{2,}",
+    "entropic": r"\d{4,}ent",
+    "even_odd": r"\d{2,}[oe]",
+    "extra_regions": r"\d{2,}er",
+    "fortress": r"\d{2,}fort",
+    "german_whispers": r"\d{4,}gw",
+    "killer": r"\d{2,}k\d{1,3}",
+    "kropki": r"\d{4}[bw]",
+    "little_killer": r"\d{2,}lk\d{1,3}",
+    "modular_lines": r"\d{4,}ml",
+    "palindrome": r"\d{4,}p",
+    "quadruple": r"\d{4,}q",
+    "region_sum_lines": r"\d{4,}rsl",
+    "renban": r"\d{4,}r",
+    "thermo": r"\d{4,}t",
+    "xv": r"\d{4}[xv]",
+}
+CLUE_LINE = re.compile("^(?:" + "|".join(
+    f"(?P<{kind}>{pattern})" for kind, pattern in CLUE_PATTERNS.items()) + ")$")
+
+# rules that apply to the whole grid are switched on by a line such as
+# "antiking: true". One line could switch on several of them, so every rule is
+# checked against each line that does not start with a digit
+RULE_PATTERNS = {
+    "anticonsecutive": re.compile(r"anti-?consecutive:?.*true"),
+    "antiking": re.compile(r"anti-?king:?.*true"),
+    "antiknight": re.compile(r"anti-?knight:?.*true"),
+    "diagonal": re.compile(r"diagonal:?.*true"),
+    "neg_kropki": re.compile(r"neg(ative)?-?\s?_kropki:?.*true"),
+    "neg_xv": re.compile(r"neg(ative)?-?\s?_xv:?.*true"),
+}
+
+
+def iter_puzzle_lines(lines: Iterable[str], name: str = "<stream>") -> Iterator[list[str]]:
+    # lazily split a stream of lines into the lines of each puzzle, so that any
+    # number of puzzles can be read with constant memory. Puzzles are either
+    # written out over several lines and separated by a line of dashes, or
+    # given on a single line. Text between puzzles without any grid rows or
+    # grid size, such as a CSV header, is skipped, but ValueError is raised for
+    # a one-line puzzle with the wrong number of cells
+    def is_puzzle(block: list[str]) -> bool:
+        return any(GIVENS_ROW.match(x.strip()) or SIZE_LINE.match(x.strip()) for x in block)
+
+    block = []
+    for n, line in enumerate(lines, start=1):
+        stripped = line.strip()
+        one_line = ONE_LINE_PUZZLE.match(stripped)
+        if one_line:
+            grid = one_line.group(1).replace("0", ".")
+            yield [grid[i*9: (i+1)*9] for i in range(9)]
+            continue
+        cells = LEADING_CELLS.match(stripped)
+        if cells and len(cells.group(1)) > LONGEST_ROW:
+            raise ValueError(f"Line {n} of {name} has {len(cells.group(1))} cells, "
+                             "but a puzzle on one line needs 81")
+        if PUZZLE_SEPARATOR.match(stripped):
+            if is_puzzle(block):
+                yield block
+            block = []
+        else:
+            block.append(line)
+    if is_puzzle(block):
+        yield block
+
+
+def split_puzzles(filename: str) -> list[list[str]]:
+    # split a file into the lines of each puzzle it contains
+    with open(filename, "r") as f:
+        return list(iter_puzzle_lines(f, filename))
+
+
+def parse_stream(lines: Iterable[str], name: str = "<stream>") -> Iterator[dict[str, list[str] | bool]]:
+    # lazily parse every puzzle in a stream, such as an open file or sys.stdin
+    for n, puzzle_lines in enumerate(iter_puzzle_lines(lines, name), start=1):
+        yield InputParser(f"{name}#{n}", puzzle_lines).parse()
 
 
 class InputParser:
 
-    def __init__(self, filename: str) -> None:
+    def __init__(self, filename: str, lines: list[str] | None = None) -> None:
+        # lines may be given when the puzzle has already been read, e.g. as one
+        # of several puzzles in a single file. filename is then only used in messages
         self.filename = filename
+        self.lines = lines
 
     def read_file(self) -> list[str]:
+        if self.lines is not None:
+            return list(filter(None, [x.strip().lower() for x in self.lines]))
         with open(self.filename, "r") as f:
             # strip whitespace from lines and remove any line that is only whitespace
             return list(filter(None, [x.strip().lower() for x in f.readlines()]))
 
-    def parse_givens(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^[\d\.]{9}$")
-        valid = list(filter(pattern.match, input))
-        if len(valid) != 9:
+    def parse(self) -> dict[str, list[str] | bool | int]:
+        parsed_puzzle = {kind: [] for kind in CLUE_PATTERNS}
+        parsed_puzzle.update((rule, False) for rule in RULE_PATTERNS)
+        parsed_puzzle["size"] = 9
+
+        # a single pass over the lines, handing each one to the kind it matches
+        match_clue = CLUE_LINE.match
+        lines = self.read_file()
+        for line in lines:
+            clue = match_clue(line)
+            if clue is not None:
+                parsed_puzzle[clue.lastgroup].append(line)
+            elif not line[0].isdigit():
+                size = SIZE_LINE.match(line)
+                if size is not None:
+                    parsed_puzzle["size"] = int(size.group(1))
+                for rule, pattern in RULE_PATTERNS.items():
+                    if pattern.match(line):
+                        parsed_puzzle[rule] = True
+
+        if parsed_puzzle["size"] != 9:
+            return self.parse_sized(lines, parsed_puzzle)
+        if len(parsed_puzzle["givens"]) != 9:
             raise ValueError(
                 f"There are not exactly 9 valid rows in {self.filename}")
-        return valid
-
-    def parse_arrow(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4,}a$")
-        return list(filter(pattern.match, input))
-
-    def parse_clone(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{2,}clone\d{2,}$")
-        return list(filter(pattern.match, input))
-
-    def parse_entropic(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4,}ent$")
-        return list(filter(pattern.match, input))
-
-    def parse_even_odd(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{2,}[oe]$")
-        return list(filter(pattern.match, input))
-
-    def parse_extra_regions(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{2,}er$")
-        return list(filter(pattern.match, input))
-
-    def parse_fortress(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{2,}fort$")
-        return list(filter(pattern.match, input))
-
-    def parse_german_whispers(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4,}gw$")
-        return list(filter(pattern.match, input))
-
-    def parse_killer(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{2,}k\d{1,3}$")
-        return list(filter(pattern.match, input))
-
-    def parse_kropki(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4}[bw]$")
-        return list(filter(pattern.match, input))
-
-    def parse_little_killer(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{2,}lk\d{1,3}$")
-        return list(filter(pattern.match, input))
-
-    def parse_modular_lines(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4,}ml$")
-        return list(filter(pattern.match, input))
-
-    def parse_palindrome(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4,}p$")
-        return list(filter(pattern.match, input))
-
-    def parse_quadruple(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4,}q$")
-        return list(filter(pattern.match, input))
-
-    def parse_region_sum_lines(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4,}rsl$")
-        return list(filter(pattern.match, input))
-
-    def parse_renban(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4,}r$")
-        return list(filter(pattern.match, input))
-
-    def parse_thermo(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4,}t$")
-        return list(filter(pattern.match, input))
-
-    def parse_xv(self, input: list[str]) -> list[str]:
-        pattern = re.compile("^\d{4}[xv]$")
-        return list(filter(pattern.match, input))
-
-    def is_anticonsecutive(self, input: list[str]) -> bool:
-        pattern = re.compile("anti-?consecutive:?.*true")
-        valid = list(filter(pattern.match, input))
-        return len(valid) > 0
-
-    def is_antiking(self, input: list[str]) -> bool:
-        pattern = re.compile("anti-?king:?.*true")
-        valid = list(filter(pattern.match, input))
-        return len(valid) > 0
-
-    def is_antiknight(self, input: list[str]) -> bool:
-        pattern = re.compile("anti-?knight:?.*true")
-        valid = list(filter(pattern.match, input))
-        return len(valid) > 0
-
-    def is_diagonal(self, input: list[str]) -> bool:
-        pattern = re.compile("diagonal:?.*true")
-        valid = list(filter(pattern.match, input))
-        return len(valid) > 0
-
-    def is_negative_kropki(self, input: list[str]) -> bool:
-        pattern = re.compile("neg(ative)?-?\s?_kropki:?.*true")
-        valid = list(filter(pattern.match, input))
-        return len(valid) > 0
-
-    def is_negative_xv(self, input: list[str]) -> bool:
-        pattern = re.compile("neg(ative)?-?\s?_xv:?.*true")
-        valid = list(filter(pattern.match, input))
-        return len(valid) > 0
-
-    def parse(self) -> dict[str, list[str] | bool]:
-        parsed_puzzle = {}
-        input = self.read_file()
-
-        parsed_puzzle["givens"] = self.parse_givens(input)
-        parsed_puzzle["arrow"] = self.parse_arrow(input)
-        parsed_puzzle["clone"] = self.parse_clone(input)
-        parsed_puzzle["entropic"] = self.parse_entropic(input)
-        parsed_puzzle["even_odd"] = self.parse_even_odd(input)
-        parsed_puzzle["extra_regions"] = self.parse_extra_regions(input)
-        parsed_puzzle["fortress"] = self.parse_fortress(input)
-        parsed_puzzle["german_whispers"] = self.parse_german_whispers(input)
-        parsed_puzzle["killer"] = self.parse_killer(input)
-        parsed_puzzle["kropki"] = self.parse_kropki(input)
-        parsed_puzzle["little_killer"] = self.parse_little_killer(input)
-        parsed_puzzle["modular_lines"] = self.parse_modular_lines(input)
-        parsed_puzzle["palindrome"] = self.parse_palindrome(input)
-        parsed_puzzle["quadruple"] = self.parse_quadruple(input)
-        parsed_puzzle["region_sum_lines"] = self.parse_region_sum_lines(input)
-        parsed_puzzle["renban"] = self.parse_renban(input)
-        parsed_puzzle["thermo"] = self.parse_thermo(input)
-        parsed_puzzle["xv"] = self.parse_xv(input)
-
-        parsed_puzzle["anticonsecutive"] = self.is_anticonsecutive(input)
-        parsed_puzzle["antiking"] = self.is_antiking(input)
-        parsed_puzzle["antiknight"] = self.is_antiknight(input)
-        parsed_puzzle["diagonal"] = self.is_diagonal(input)
-        parsed_puzzle["neg_kropki"] = self.is_negative_kropki(input)
-        parsed_puzzle["neg_xv"] = self.is_negative_xv(input)
+        return parsed_puzzle
 
+    def parse_sized(self, lines: list[str], parsed_puzzle: dict[str, list[str] | bool | int]
+                    ) -> dict[str, list[str] | bool | int]:
+        # the rows of other grid sizes can look like 9x9 clues, so once the size
+        # is known the lines are sorted again, with its rows matched first
+        size = parsed_puzzle["size"]
+        match_row = sized_row(size).match
+        parsed_puzzle.update((kind, []) for kind in CLUE_PATTERNS)
+        for line in lines:
+            if match_row(line):
+                parsed_puzzle["givens"].append(line)
+            else:
+                # kept only so that Puzzle.from_parsed can report them as unsupported
+                clue = CLUE_LINE.match(line)
+                if clue is not None and clue.lastgroup != "givens":
+                    parsed_puzzle[clue.lastgroup].append(line)
+
+        if len(parsed_puzzle["givens"]) != size:
+            raise ValueError(
+                f"There are not exactly {size} valid rows in {self.filename}")
         return parsed_puzzle
+
+    def parse_puzzle(self) -> Puzzle:
+        # parse into the typed form that the solving engines build their models from
+        return Puzzle.from_parsed(self.parse())
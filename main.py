@@ -1,28 +1,86 @@
+import argparse
 import json
+import sys
 
-from input_parser import InputParser
-from solver import Solver
-from sudoku_model import SudokuModel
+from input_parser import InputParser, parse_stream
+from puzzle import Puzzle
+from solution_cache import DEFAULT_CACHE_PATH, SolutionCache
+from solver import EMPHASES, ENGINES, THREAD_SETTINGS, SolverConfig, count_solutions, solve_puzzle
 
-FILEPATH = "puzzles/classic.txt"
-parser = InputParser(FILEPATH)
-model = SudokuModel(parser.parse())
-model.add_constraints()
+DEFAULT_FILEPATH = "puzzles/classic.txt"
 
-# Useful for checking you have inputted the puzzle correctly
-print(json.dumps(model.input, indent=2))
+arg_parser = argparse.ArgumentParser(description="Solve a Sudoku puzzle")
+arg_parser.add_argument("filepath", nargs="?", default=DEFAULT_FILEPATH,
+                        help="puzzle file to solve, or - to read the first puzzle from stdin")
+arg_parser.add_argument("--engine", choices=ENGINES, default="mip",
+                        help="solving engine to use (default: mip)")
+arg_parser.add_argument("--cache", nargs="?", const=DEFAULT_CACHE_PATH, metavar="PATH",
+                        help="reuse solutions stored in this sqlite file, and store new "
+                             f"ones in it (default: {DEFAULT_CACHE_PATH})")
+arg_parser.add_argument("--time-limit", type=float, metavar="SECONDS",
+                        help="give up after this many seconds of searching")
+arg_parser.add_argument("--threads", type=int, choices=THREAD_SETTINGS, default=0,
+                        help="0 lets CBC choose how many threads to use and -1 uses every core "
+                             "(default: 0)")
+arg_parser.add_argument("--emphasis", choices=EMPHASES, default="default",
+                        help="whether CBC's search favours finding a solution or proving it")
+arg_parser.add_argument("--strengthen", action="store_true",
+                        help="add redundant constraints and symmetry breaks to the model")
+arg_parser.add_argument("--cold-start", action="store_true",
+                        help="build the model without first running the propagation engine's "
+                             "constraints on the givens")
+arg_parser.add_argument("--check-unique", action="store_true",
+                        help="also check that the puzzle has exactly one solution")
+arg_parser.add_argument("--parse-only", action="store_true",
+                        help="only check the puzzle and print it as parsed, without "
+                             "loading a solver")
+args = arg_parser.parse_args()
+
+try:
+    if args.filepath == "-":
+        puzzle = next(parse_stream(sys.stdin, "<stdin>"), None)
+        if puzzle is None:
+            sys.exit("No puzzle found on stdin")
+    else:
+        parser = InputParser(args.filepath)
+        puzzle = parser.parse()
+    # converting to the typed form checks the cells of every clue
+    Puzzle.from_parsed(puzzle)
+except ValueError as e:
+    sys.exit(str(e))
 
-solver = Solver(model)
-solution = solver.solve()
+# Useful for checking you have inputted the puzzle correctly
+print(json.dumps(puzzle, indent=2))
+if args.parse_only:
+    sys.exit()
 
-solution_string = ""
-for i in range(9):
-    for j in range(9):
-        for k in range(9):
-            if solution[i][j][k].x == 1:
-                solution_string += str(k + 1)
-                break
+config = SolverConfig(time_limit=args.time_limit, threads=args.threads, emphasis=args.emphasis,
+                      strengthen=args.strengthen, warm_start=not args.cold_start)
+cache = SolutionCache(args.cache) if args.cache else None
+try:
+    solution_string = solve_puzzle(puzzle, args.engine, cache, config)
+except TimeoutError as e:
+    sys.exit(f"\n== TIMED OUT ==\n{e}")
+except ValueError as e:
+    # such as a grid size the chosen engine can't solve
+    sys.exit(str(e))
+finally:
+    if cache is not None:
+        cache.close()
+if solution_string is None:
+    print("\n== NO SOLUTION ==")
+else:
+    print("\n== SOLUTION ==\n")
+    size = puzzle["size"]
+    for i in range(size):
+        print(solution_string[i*size: (i+1)*size])
 
-print("\n== SOLUTION ==\n")
-for i in range(9):
-    print(solution_string[i*9: (i+1)*9])
+if args.check_unique:
+    try:
+        count = count_solutions(puzzle, 2, args.engine, config)
+    except TimeoutError as e:
+        sys.exit(f"\n== TIMED OUT ==\n{e}")
+    if count == 1:
+        print("\nThe solution is unique")
+    else:
+        print("\nThe puzzle does not have a unique solution")
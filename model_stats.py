@@ -0,0 +1,42 @@
+from dataclasses import asdict, dataclass, field
+
+
+@dataclass(slots=True)
+class FamilyStats:
+    # what adding one family of constraints cost
+    seconds: float = 0.0
+    rows: int = 0
+    nonzeros: int = 0
+
+
+@dataclass(slots=True)
+class ModelStats:
+    # build and solve statistics gathered by a SudokuModel as it goes, for
+    # finding which rules make a model large or slow. Every solve of the model
+    # adds to the solve totals
+    families: dict[str, FamilyStats] = field(default_factory=dict)
+    solves: int = 0
+    solve_seconds: float = 0.0
+    # branch and bound nodes and simplex iterations over every solve
+    nodes: int = 0
+    iterations: int = 0
+
+    def record_family(self, family: str, seconds: float, rows: int, nonzeros: int) -> None:
+        stats = self.families.setdefault(family, FamilyStats())
+        stats.seconds += seconds
+        stats.rows += rows
+        stats.nonzeros += nonzeros
+
+    def record_solve(self, seconds: float, nodes: int, iterations: int) -> None:
+        self.solves += 1
+        self.solve_seconds += seconds
+        self.nodes += nodes
+        self.iterations += iterations
+
+    @property
+    def build_seconds(self) -> float:
+        return sum(stats.seconds for stats in self.families.values())
+
+    def to_dict(self) -> dict:
+        # a JSON serializable form, for passing on to metrics systems
+        return {**asdict(self), "build_seconds": self.build_seconds}
@@ -0,0 +1,702 @@
+from functools import lru_cache
+from itertools import islice
+from typing import Callable, Iterator
+
+from digit_sets import SUM_COMBINATIONS
+from puzzle import CONSTRAINT_FAMILIES, Puzzle
+
+# candidates for a cell are held as a 9 bit mask, where bit k set means the
+# digit k + 1 is still possible in that cell. Cells are indexed 0-80 row by row
+ALL_DIGITS = 0x1FF
+DIGIT_BITS = [1 << k for k in range(9)]
+POPCOUNT = [bin(mask).count("1") for mask in range(ALL_DIGITS + 1)]
+
+
+def mask_of(digits) -> int:
+    mask = 0
+    for d in digits:
+        mask |= DIGIT_BITS[d - 1]
+    return mask
+
+
+def value_range_mask(low: int, high: int) -> int:
+    # mask of the digits d where low <= d <= high
+    return mask_of(range(max(low, 1), min(high, 9) + 1))
+
+
+@lru_cache(maxsize=None)
+def support_table(allowed: frozenset[tuple[int, int]]) -> tuple[int, ...]:
+    # for a relation between cells a and b given by its allowed (a, b) digit pairs,
+    # map every candidate mask of a to the mask of digits b can still take
+    partners = [0] * 9
+    for x, y in allowed:
+        partners[x - 1] |= DIGIT_BITS[y - 1]
+    table = [0] * (ALL_DIGITS + 1)
+    for mask in range(1, ALL_DIGITS + 1):
+        low = mask & -mask
+        table[mask] = table[mask ^ low] | partners[low.bit_length() - 1]
+    return tuple(table)
+
+
+@lru_cache(maxsize=None)
+def sum_combinations(size: int, total: int) -> tuple[int, ...]:
+    # masks of every set of size distinct digits that sums to total
+    return tuple(mask_of(combo) for combo in SUM_COMBINATIONS.get((size, total), ()))
+
+
+@lru_cache(maxsize=None)
+def consecutive_runs(size: int) -> tuple[int, ...]:
+    # masks of every run of size consecutive digits
+    return tuple(mask_of(range(low, low + size)) for low in range(1, 11 - size))
+
+
+def relation_pairs(rule: Callable[[int, int], bool]) -> frozenset[tuple[int, int]]:
+    return frozenset((a, b) for a in range(1, 10) for b in range(1, 10) if rule(a, b))
+
+
+NOT_EQUAL = relation_pairs(lambda a, b: a != b)
+EQUAL = relation_pairs(lambda a, b: a == b)
+INCREASING = relation_pairs(lambda a, b: a < b)
+DECREASING = relation_pairs(lambda a, b: a > b)
+WHISPERS = relation_pairs(lambda a, b: abs(a - b) >= 5)
+KROPKI_WHITE = relation_pairs(lambda a, b: abs(a - b) == 1)
+KROPKI_BLACK = relation_pairs(lambda a, b: a == 2 * b or b == 2 * a)
+NEG_KROPKI = relation_pairs(lambda a, b: abs(a - b) != 1 and a != 2 * b and b != 2 * a)
+XV_X = relation_pairs(lambda a, b: a + b == 10)
+XV_V = relation_pairs(lambda a, b: a + b == 5)
+NEG_XV = relation_pairs(lambda a, b: a + b not in (5, 10))
+NONCONSECUTIVE = relation_pairs(lambda a, b: abs(a - b) != 1)
+
+
+class Contradiction(Exception):
+    pass
+
+
+class SearchLimit(Exception):
+    # raised when a search branches more than PropagationSolver.node_limit times
+    pass
+
+
+class AllDifferent:
+    # no digit may repeat in cells. If exact, every digit must also appear,
+    # which allows hidden singles to be placed
+
+    def __init__(self, cells: list[int], exact: bool = False) -> None:
+        self.cells = cells
+        self.exact = exact
+
+    def propagate(self, cands: list[int]) -> None:
+        fixed = 0
+        for c in self.cells:
+            m = cands[c]
+            if not m & (m - 1):
+                if m & fixed:
+                    raise Contradiction
+                fixed |= m
+
+        seen_once = 0
+        seen_twice = 0
+        for c in self.cells:
+            m = cands[c]
+            if m & (m - 1):
+                m &= ~fixed
+                if not m:
+                    raise Contradiction
+                cands[c] = m
+            seen_twice |= seen_once & m
+            seen_once |= m
+
+        if POPCOUNT[seen_once] < len(self.cells):
+            raise Contradiction
+        if not self.exact:
+            return
+        if seen_once != ALL_DIGITS:
+            raise Contradiction
+
+        hidden = seen_once & ~seen_twice & ~fixed
+        if hidden:
+            for c in self.cells:
+                m = cands[c] & hidden
+                if m:
+                    if m & (m - 1):
+                        raise Contradiction
+                    cands[c] = m
+
+
+class Intersection:
+    # a box and a row or column overlap in 3 cells, and both must contain every
+    # digit. A digit missing from the rest of one of them has to sit in the
+    # overlap, so it can be removed from the rest of the other
+
+    def __init__(self, overlap: list[int], box_rest: list[int], line_rest: list[int]) -> None:
+        self.box_rest = box_rest
+        self.line_rest = line_rest
+        self.cells = overlap + box_rest + line_rest
+
+    def propagate(self, cands: list[int]) -> None:
+        in_box_rest = 0
+        for c in self.box_rest:
+            in_box_rest |= cands[c]
+        in_line_rest = 0
+        for c in self.line_rest:
+            in_line_rest |= cands[c]
+
+        for rest, keep in [(self.line_rest, in_box_rest), (self.box_rest, in_line_rest)]:
+            if keep == ALL_DIGITS:
+                continue
+            for c in rest:
+                m = cands[c] & keep
+                if not m:
+                    raise Contradiction
+                cands[c] = m
+
+
+class Relation:
+    # a binary relation between the digits in cells a and b
+
+    def __init__(self, a: int, b: int, allowed: frozenset[tuple[int, int]]) -> None:
+        self.cells = [a, b]
+        self.forward = support_table(allowed)
+        self.backward = support_table(frozenset((y, x) for x, y in allowed))
+
+    def propagate(self, cands: list[int]) -> None:
+        a, b = self.cells
+        mb = cands[b] & self.forward[cands[a]]
+        if not mb:
+            raise Contradiction
+        ma = cands[a] & self.backward[mb]
+        if not ma:
+            raise Contradiction
+        cands[a] = ma
+        cands[b] = mb
+
+
+class LinearSum:
+    # sum(coef * digit) == total, with each coef either 1 or -1. Only the bounds
+    # of each term are propagated, which is exact once all cells are placed
+
+    def __init__(self, terms: list[tuple[int, int]], total: int) -> None:
+        self.terms = terms
+        self.cells = [c for c, _ in terms]
+        self.total = total
+
+    def propagate(self, cands: list[int]) -> None:
+        bounds = []
+        low = high = 0
+        for c, coef in self.terms:
+            m = cands[c]
+            # lowest and highest digit remaining in the cell
+            d_min = (m & -m).bit_length()
+            d_max = m.bit_length()
+            if coef > 0:
+                bounds.append((d_min, d_max))
+            else:
+                bounds.append((-d_max, -d_min))
+            low += bounds[-1][0]
+            high += bounds[-1][1]
+
+        if low > self.total or high < self.total:
+            raise Contradiction
+
+        for (c, coef), (t_min, t_max) in zip(self.terms, bounds):
+            # the range this term can take given the bounds of the others
+            t_low = self.total - (high - t_max)
+            t_high = self.total - (low - t_min)
+            if t_low <= t_min and t_high >= t_max:
+                continue
+            if coef > 0:
+                m = cands[c] & value_range_mask(t_low, t_high)
+            else:
+                m = cands[c] & value_range_mask(-t_high, -t_low)
+            if not m:
+                raise Contradiction
+            cands[c] = m
+
+
+class DigitSets:
+    # the distinct digits in cells make up one of the given sets of digits, e.g.
+    # the sets that sum to a killer cage total. Only sets that can still be
+    # placed in the cells are kept
+
+    def __init__(self, cells: list[int], combos: tuple[int, ...]) -> None:
+        self.cells = cells
+        self.combos = combos
+
+    def propagate(self, cands: list[int]) -> None:
+        fixed = 0
+        union = 0
+        for c in self.cells:
+            m = cands[c]
+            union |= m
+            if not m & (m - 1):
+                fixed |= m
+
+        valid = 0
+        for combo in self.combos:
+            if fixed & ~combo or combo & ~union:
+                continue
+            if all(cands[c] & combo for c in self.cells):
+                valid |= combo
+        if not valid:
+            raise Contradiction
+
+        for c in self.cells:
+            m = cands[c] & valid
+            if not m:
+                raise Contradiction
+            cands[c] = m
+
+
+class EqualSums:
+    # every segment sums to the same total. The digits within a segment must be
+    # distinct, which holds as each segment lies inside a single 3x3 region.
+    # The shared total is itself a search variable, whose mask has bit s set
+    # while s is still a possible total
+
+    def __init__(self, segments: list[list[int]], total: int) -> None:
+        self.segments = segments
+        self.total = total
+        self.cells = [c for segment in segments for c in segment] + [total]
+        # segment candidate masks -> {sum: digits supporting that sum, per cell}
+        self.cache = {}
+
+    def segment_support(self, masks: tuple[int, ...]) -> dict[int, list[int]]:
+        if masks in self.cache:
+            return self.cache[masks]
+
+        support = {}
+        placed = []
+
+        def place(i: int, used: int, total: int) -> None:
+            if i == len(masks):
+                per_cell = support.setdefault(total, [0] * len(masks))
+                for idx, bit in enumerate(placed):
+                    per_cell[idx] |= bit
+                return
+            m = masks[i] & ~used
+            while m:
+                bit = m & -m
+                m ^= bit
+                placed.append(bit)
+                place(i + 1, used | bit, total + bit.bit_length())
+                placed.pop()
+
+        place(0, 0, 0)
+        self.cache[masks] = support
+        return support
+
+    def propagate(self, cands: list[int]) -> None:
+        supports = [self.segment_support(tuple(cands[c] for c in segment))
+                    for segment in self.segments]
+        common = cands[self.total]
+        for support in supports:
+            totals = 0
+            for total in support:
+                totals |= 1 << total
+            common &= totals
+        if not common:
+            raise Contradiction
+        cands[self.total] = common
+
+        for segment, support in zip(self.segments, supports):
+            for idx, c in enumerate(segment):
+                allowed = 0
+                for total, per_cell in support.items():
+                    if common >> total & 1:
+                        allowed |= per_cell[idx]
+                m = cands[c] & allowed
+                if not m:
+                    raise Contradiction
+                cands[c] = m
+
+
+class GroupAllDifferent:
+    # digits are split into 3 groups and no group may repeat in cells. If exact,
+    # every group must appear (cells is then always 3 cells long)
+
+    def __init__(self, cells: list[int], groups: list[list[int]], exact: bool) -> None:
+        self.cells = cells
+        self.group_masks = [mask_of(g) for g in groups]
+        self.exact = exact
+
+    def propagate(self, cands: list[int]) -> None:
+        # group_sets[i] is a bitmask of the groups still possible in cell i
+        group_sets = []
+        for c in self.cells:
+            gs = 0
+            for g, gm in enumerate(self.group_masks):
+                if cands[c] & gm:
+                    gs |= 1 << g
+            group_sets.append(gs)
+
+        fixed = 0
+        for gs in group_sets:
+            if not gs & (gs - 1):
+                if gs & fixed:
+                    raise Contradiction
+                fixed |= gs
+
+        seen_once = 0
+        seen_twice = 0
+        for i, c in enumerate(self.cells):
+            gs = group_sets[i]
+            if gs & (gs - 1):
+                gs &= ~fixed
+                group_sets[i] = gs
+            seen_twice |= seen_once & gs
+            seen_once |= gs
+
+        hidden = seen_once & ~seen_twice & ~fixed if self.exact else 0
+        if self.exact and seen_once != 0b111:
+            raise Contradiction
+
+        for i, c in enumerate(self.cells):
+            gs = group_sets[i]
+            if gs & hidden:
+                gs &= hidden
+            allowed = 0
+            for g, gm in enumerate(self.group_masks):
+                if gs & (1 << g):
+                    allowed |= gm
+            m = cands[c] & allowed
+            if not m:
+                raise Contradiction
+            cands[c] = m
+
+
+class Quadruple:
+    # the given digits must all appear in cells, counting repeats
+
+    def __init__(self, cells: list[int], digits: list[int]) -> None:
+        self.cells = cells
+        self.counts = {d: digits.count(d) for d in set(digits)}
+
+    def propagate(self, cands: list[int]) -> None:
+        for d, count in self.counts.items():
+            bit = DIGIT_BITS[d - 1]
+            possible = [c for c in self.cells if cands[c] & bit]
+            if len(possible) < count:
+                raise Contradiction
+            if sum(1 for c in possible if cands[c] == bit) > count:
+                raise Contradiction
+            if len(possible) == count:
+                for c in possible:
+                    cands[c] = bit
+
+        if sum(self.counts.values()) == len(self.cells):
+            required = mask_of(self.counts)
+            for c in self.cells:
+                m = cands[c] & required
+                if not m:
+                    raise Contradiction
+                cands[c] = m
+
+
+class PropagationSolver:
+
+    # the families add_constraints adds, in order
+    constraint_families = CONSTRAINT_FAMILIES
+
+    def __init__(self, puzzle: Puzzle) -> None:
+        if puzzle.size != 9:
+            raise ValueError("The propagation engine only solves 9x9 grids, use the mip engine")
+        self.puzzle = puzzle
+        # candidates for the 81 cells, followed by the domain masks of any
+        # auxiliary variables that constraints introduce
+        self.candidates = [ALL_DIGITS] * 81
+        self.propagators = []
+        # watchers[c] holds the index of every propagator that involves cell c
+        self.watchers = [[] for _ in range(81)]
+        # the branches searched so far, beyond which search raises SearchLimit
+        # when node_limit is set
+        self.nodes = 0
+        self.node_limit = None
+
+    def add_variable(self, domain: int) -> int:
+        self.candidates.append(domain)
+        self.watchers.append([])
+        return len(self.candidates) - 1
+
+    def add_propagator(self, propagator) -> None:
+        index = len(self.propagators)
+        self.propagators.append(propagator)
+        for c in set(propagator.cells):
+            self.watchers[c].append(index)
+
+    def restrict(self, cell: int, mask: int) -> None:
+        self.candidates[cell] &= mask
+
+    def add_standard_constraints(self) -> None:
+        for i in range(9):
+            self.add_propagator(AllDifferent(
+                [i * 9 + j for j in range(9)], exact=True))
+            self.add_propagator(AllDifferent(
+                [j * 9 + i for j in range(9)], exact=True))
+        for i2 in range(3):
+            for j2 in range(3):
+                box = [i * 9 + j
+                       for i in range(i2 * 3, i2 * 3 + 3)
+                       for j in range(j2 * 3, j2 * 3 + 3)]
+                self.add_propagator(AllDifferent(box, exact=True))
+
+                # box/line intersections for every row and column through the box
+                lines = ([[i * 9 + j for j in range(9)] for i in range(i2 * 3, i2 * 3 + 3)]
+                         + [[i * 9 + j for i in range(9)] for j in range(j2 * 3, j2 * 3 + 3)])
+                for line in lines:
+                    self.add_propagator(Intersection(
+                        [c for c in box if c in line],
+                        [c for c in box if c not in line],
+                        [c for c in line if c not in box]))
+
+    def add_given_constraints(self) -> None:
+        for c, given in enumerate(self.puzzle.givens):
+            if given:
+                self.restrict(c, DIGIT_BITS[given - 1])
+
+    def add_arrow_constraints(self) -> None:
+        for clue in self.puzzle.arrow:
+            terms = [(c, 1) for c in clue.shaft] + [(clue.circle, -1)]
+            self.add_propagator(LinearSum(terms, 0))
+
+    def add_clone_constraints(self) -> None:
+        for clue in self.puzzle.clone:
+            for a, b in zip(clue.cells, clue.copy):
+                self.add_propagator(Relation(a, b, EQUAL))
+
+    def add_entropic_constraints(self) -> None:
+        groups = [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+        for cells in self.puzzle.entropic:
+            self.add_group_lines(cells, groups)
+
+    def add_even_odd_constraints(self) -> None:
+        for clue in self.puzzle.even_odd:
+            mask = mask_of([2, 4, 6, 8] if clue.even else [1, 3, 5, 7, 9])
+            for c in clue.cells:
+                self.restrict(c, mask)
+
+    def add_extra_regions_constraints(self) -> None:
+        for cells in self.puzzle.extra_regions:
+            self.add_propagator(AllDifferent(cells, exact=len(cells) == 9))
+
+    def add_fortress_constraints(self) -> None:
+        for cells in self.puzzle.fortress:
+            for c in cells:
+                i, j = divmod(c, 9)
+                for i2, j2 in [(i - 1, j), (i, j - 1), (i, j + 1), (i + 1, j)]:
+                    # ignore any other fortresses, as well as any cells out of bounds
+                    if 0 <= i2 < 9 and 0 <= j2 < 9 and i2 * 9 + j2 not in cells:
+                        self.add_propagator(Relation(c, i2 * 9 + j2, DECREASING))
+
+    def add_german_whispers_constraints(self) -> None:
+        for cells in self.puzzle.german_whispers:
+            for a, b in zip(cells, cells[1:]):
+                self.add_propagator(Relation(a, b, WHISPERS))
+
+    def add_killer_constraints(self) -> None:
+        for cage in self.puzzle.killer:
+            self.add_propagator(AllDifferent(cage.cells))
+            if cage.total != 0:
+                self.add_propagator(DigitSets(
+                    cage.cells, sum_combinations(len(cage.cells), cage.total)))
+
+    def add_kropki_constraints(self) -> None:
+        for dot in self.puzzle.kropki:
+            self.add_propagator(Relation(
+                dot.a, dot.b, KROPKI_WHITE if dot.kind == "w" else KROPKI_BLACK))
+
+    def add_little_killer_constraints(self) -> None:
+        for clue in self.puzzle.little_killer:
+            self.add_propagator(LinearSum([(c, 1) for c in clue.cells], clue.total))
+
+    def add_modular_lines_constraints(self) -> None:
+        groups = [[1, 4, 7], [2, 5, 8], [3, 6, 9]]
+        for cells in self.puzzle.modular_lines:
+            self.add_group_lines(cells, groups)
+
+    def add_group_lines(self, cells: tuple[int, ...], groups: list[list[int]]) -> None:
+        # every 3 consecutive cells take one digit from each group
+        if len(cells) == 2:
+            self.add_propagator(GroupAllDifferent(list(cells), groups, exact=False))
+        for i in range(len(cells) - 2):
+            self.add_propagator(GroupAllDifferent(list(cells[i:i + 3]), groups, exact=True))
+
+        # which means cells 3 apart along the line take digits from the same group
+        group_of = {d: g for g, group in enumerate(groups) for d in group}
+        same_group = relation_pairs(lambda a, b: group_of[a] == group_of[b])
+        for a, b in zip(cells, cells[3:]):
+            self.add_propagator(Relation(a, b, same_group))
+
+    def add_palindrome_constraints(self) -> None:
+        for cells in self.puzzle.palindrome:
+            for i in range(len(cells) // 2):
+                self.add_propagator(Relation(cells[i], cells[-i-1], EQUAL))
+
+    def add_quadruple_constraints(self) -> None:
+        for q in self.puzzle.quadruple:
+            self.add_propagator(Quadruple(list(q.cells), list(q.digits)))
+
+    def add_region_sum_line_constraints(self) -> None:
+        for cells in self.puzzle.region_sum_lines:
+            # separate groups of cells into each distinct 3x3 region
+            separated = [[cells[0]]]
+            for c1, c2 in zip(cells, cells[1:]):
+                if c1 // 27 == c2 // 27 and c1 % 9 // 3 == c2 % 9 // 3:
+                    separated[-1].append(c2)
+                else:
+                    separated.append([c2])
+
+            if len(separated) > 1:
+                # any total from 1 to 45 is possible to begin with
+                total = self.add_variable((1 << 46) - 2)
+                self.add_propagator(EqualSums(separated, total))
+
+    def add_renban_constraints(self) -> None:
+        for cells in self.puzzle.renban:
+            self.add_propagator(AllDifferent(cells))
+            self.add_propagator(DigitSets(cells, consecutive_runs(len(cells))))
+
+    def add_thermo_constraints(self) -> None:
+        for cells in self.puzzle.thermo:
+            for a, b in zip(cells, cells[1:]):
+                self.add_propagator(Relation(a, b, INCREASING))
+
+    def add_xv_constraints(self) -> None:
+        for mark in self.puzzle.xv:
+            self.add_propagator(Relation(mark.a, mark.b, XV_X if mark.kind == "x" else XV_V))
+
+    def add_anticonsecutive_constraints(self) -> None:
+        if not self.puzzle.anticonsecutive:
+            return
+        for a, b in orthogonal_pairs():
+            self.add_propagator(Relation(a, b, NONCONSECUTIVE))
+
+    def add_antiking_constraints(self) -> None:
+        if not self.puzzle.antiking:
+            return
+        # orthogonally adjacent cells are already ruled out by normal sudoku rules
+        self.add_offset_constraints([(1, -1), (1, 1)])
+
+    def add_antiknight_constraints(self) -> None:
+        if not self.puzzle.antiknight:
+            return
+        self.add_offset_constraints([(1, -2), (1, 2), (2, -1), (2, 1)])
+
+    def add_offset_constraints(self, offsets: list[tuple[int, int]]) -> None:
+        # cells separated by any of the offsets may not contain the same digit
+        for i in range(9):
+            for j in range(9):
+                for di, dj in offsets:
+                    if 0 <= i + di < 9 and 0 <= j + dj < 9:
+                        self.add_propagator(Relation(
+                            i * 9 + j, (i + di) * 9 + j + dj, NOT_EQUAL))
+
+    def add_diagonal_constraints(self) -> None:
+        if not self.puzzle.diagonal:
+            return
+        self.add_propagator(AllDifferent([i * 10 for i in range(9)], exact=True))
+        self.add_propagator(AllDifferent([i * 8 + 8 for i in range(9)], exact=True))
+
+    def add_neg_kropki_constraints(self) -> None:
+        if not self.puzzle.neg_kropki:
+            return
+        dots = {(x.a, x.b) for x in self.puzzle.kropki}
+        for a, b in orthogonal_pairs():
+            if (a, b) not in dots and (b, a) not in dots:
+                self.add_propagator(Relation(a, b, NEG_KROPKI))
+
+    def add_neg_xv_constraints(self) -> None:
+        if not self.puzzle.neg_xv:
+            return
+        marks = {(x.a, x.b) for x in self.puzzle.xv}
+        for a, b in orthogonal_pairs():
+            if (a, b) not in marks and (b, a) not in marks:
+                self.add_propagator(Relation(a, b, NEG_XV))
+
+    def add_constraints(self) -> None:
+        self.add_standard_constraints()
+        for family in self.constraint_families:
+            getattr(self, f"add_{family}_constraints")()
+
+    def propagate(self, cands: list[int], queue: list[int]) -> None:
+        # run propagators until nothing changes, re-queueing every propagator
+        # that watches a cell whose candidates were narrowed
+        propagators = self.propagators
+        watchers = self.watchers
+        queued = set(queue)
+        while queue:
+            index = queue.pop()
+            queued.discard(index)
+            propagator = propagators[index]
+            before = [cands[c] for c in propagator.cells]
+            propagator.propagate(cands)
+            for c, m in zip(propagator.cells, before):
+                if cands[c] != m:
+                    if not cands[c]:
+                        raise Contradiction
+                    for w in watchers[c]:
+                        if w not in queued:
+                            queued.add(w)
+                            queue.append(w)
+
+    def search(self, cands: list[int]) -> Iterator[list[int]]:
+        # depth first search, branching on the variable with fewest candidates,
+        # preferring those involved in the most constraints on a tie
+        best = None
+        best_key = None
+        for c in range(len(cands)):
+            count = cands[c].bit_count()
+            if count > 1:
+                key = (count, -len(self.watchers[c]))
+                if best_key is None or key < best_key:
+                    best, best_key = c, key
+        if best is None:
+            yield cands
+            return
+
+        m = cands[best]
+        while m:
+            bit = m & -m
+            m ^= bit
+            self.nodes += 1
+            if self.node_limit is not None and self.nodes > self.node_limit:
+                raise SearchLimit
+            branch = cands.copy()
+            branch[best] = bit
+            try:
+                self.propagate(branch, list(self.watchers[best]))
+            except Contradiction:
+                continue
+            yield from self.search(branch)
+
+    def propagate_all(self, cands: list[int] | None = None) -> list[int] | None:
+        # the candidates left once every propagator has run, before any search,
+        # or None when the constraints contradict each other. Starts from cands
+        # when given, which is left unchanged, and otherwise from self.candidates
+        cands = (self.candidates if cands is None else cands).copy()
+        if not all(cands):
+            return None
+        try:
+            self.propagate(cands, list(range(len(self.propagators))))
+        except Contradiction:
+            return None
+        return cands
+
+    def solutions(self) -> Iterator[str]:
+        cands = self.propagate_all()
+        if cands is None:
+            return
+        for solved in self.search(cands):
+            yield "".join(str(m.bit_length()) for m in solved[:81])
+
+    def solve(self) -> str | None:
+        # return the first solution found as an 81 character string
+        return next(self.solutions(), None)
+
+    def count_solutions(self, limit: int = 2) -> int:
+        # the search stops as soon as limit solutions have been found
+        return sum(1 for _ in islice(self.solutions(), limit))
+
+
+def orthogonal_pairs() -> list[tuple[int, int]]:
+    return ([(i * 9 + j, (i + 1) * 9 + j) for i in range(8) for j in range(9)]
+            + [(i * 9 + j, i * 9 + j + 1) for i in range(9) for j in range(8)])
@@ -0,0 +1,241 @@
+from dataclasses import asdict, dataclass, fields
+
+from grid import BOX_SHAPES, SYMBOLS
+
+# the typed form of a parsed puzzle that every engine builds its model from, so
+# that clue strings are only taken apart once. Cells are indexed 0-80 row by
+# row and digits run from 1 to 9, or for other grid sizes, from 0 to
+# size * size - 1 and from 1 to size. Every part is immutable, so a Puzzle can
+# be hashed, used as a cache key and pickled to worker processes
+
+Cells = tuple[int, ...]
+
+
+# "11" -> 0 through "99" -> 80
+CELL_INDEX = {f"{i + 1}{j + 1}": i * 9 + j for i in range(9) for j in range(9)}
+
+
+def cell_indices(clue: str) -> Cells:
+    # convert a string of 1-indexed (row, col) digit pairs into cell indices
+    try:
+        return tuple(CELL_INDEX[clue[i:i + 2]] for i in range(0, len(clue) - 1, 2))
+    except KeyError as e:
+        raise ValueError(f"Invalid cell {e.args[0]} in clue {clue}") from None
+
+
+# every family of puzzle specific constraints, in the order both engines add
+# them. Each engine adds a family with its method add_<family>_constraints, so
+# the engines and the benchmark's per-family timings all share this order
+CONSTRAINT_FAMILIES = (
+    "given", "arrow", "clone", "entropic", "even_odd", "extra_regions",
+    "fortress", "german_whispers", "killer", "kropki", "little_killer",
+    "modular_lines", "palindrome", "quadruple", "region_sum_line", "renban",
+    "thermo", "xv", "anticonsecutive", "antiking", "antiknight", "diagonal",
+    "neg_kropki", "neg_xv",
+)
+
+# the clue families and rules that can be used on grids other than 9x9. The rest
+# are written with 9x9 cell coordinates, or rely on digits running from 1 to 9
+SIZED_RULES = ("anticonsecutive", "antiking", "antiknight", "diagonal")
+
+# the digit each symbol of a givens row stands for
+SYMBOL_DIGITS = {".": 0} | {symbol: d for d, symbol in enumerate(SYMBOLS, start=1)}
+
+
+def parse_givens(rows: list[str], size: int = 9) -> tuple[int, ...]:
+    # the givens of each row, with 0 for an empty cell. A row is either a string
+    # of one symbol per cell, or the numbers of its cells separated by spaces.
+    # In both forms "." or "0" marks an empty cell
+    if size == 9:
+        return tuple(map(int, "".join(rows).replace(".", "0")))
+
+    givens = []
+    for row in rows:
+        for symbol in (row if len(row) == size else row.split()):
+            digit = int(symbol) if symbol.isdigit() else SYMBOL_DIGITS.get(symbol, -1)
+            if not 0 <= digit <= size:
+                raise ValueError(f"Invalid digit {symbol} in row {row} of a {size}x{size} grid")
+            givens.append(digit)
+    return tuple(givens)
+
+
+@dataclass(frozen=True, slots=True)
+class Arrow:
+    # the digits along the shaft sum to the digit in the circle
+    circle: int
+    shaft: Cells
+
+
+@dataclass(frozen=True, slots=True)
+class Clone:
+    # cells[i] and copy[i] hold the same digit
+    cells: Cells
+    copy: Cells
+
+
+@dataclass(frozen=True, slots=True)
+class Parity:
+    cells: Cells
+    even: bool
+
+
+@dataclass(frozen=True, slots=True)
+class Cage:
+    # killer cages and little killer diagonals. A killer cage with no total
+    # given has a total of 0
+    cells: Cells
+    total: int
+
+
+@dataclass(frozen=True, slots=True)
+class Dot:
+    # a kropki dot or an X/V between two adjacent cells. kind is "b" or "w"
+    # for kropki dots and "x" or "v" for XV
+    a: int
+    b: int
+    kind: str
+
+
+@dataclass(frozen=True, slots=True)
+class Quad:
+    # digits that must appear in the 2x2 block of cells, counting repeats
+    cells: Cells
+    digits: tuple[int, ...]
+
+
+# families whose clues are one of the types above. Every other list family is a
+# tuple of cells, in the order they were given
+CLUE_TYPES = {
+    "arrow": Arrow,
+    "clone": Clone,
+    "even_odd": Parity,
+    "killer": Cage,
+    "kropki": Dot,
+    "little_killer": Cage,
+    "quadruple": Quad,
+    "xv": Dot,
+}
+
+
+@dataclass(frozen=True, slots=True)
+class Puzzle:
+    # the size * size givens row by row, with 0 for an empty cell
+    givens: tuple[int, ...]
+    size: int = 9
+    arrow: tuple[Arrow, ...] = ()
+    clone: tuple[Clone, ...] = ()
+    entropic: tuple[Cells, ...] = ()
+    even_odd: tuple[Parity, ...] = ()
+    extra_regions: tuple[Cells, ...] = ()
+    fortress: tuple[Cells, ...] = ()
+    german_whispers: tuple[Cells, ...] = ()
+    killer: tuple[Cage, ...] = ()
+    kropki: tuple[Dot, ...] = ()
+    little_killer: tuple[Cage, ...] = ()
+    modular_lines: tuple[Cells, ...] = ()
+    palindrome: tuple[Cells, ...] = ()
+    quadruple: tuple[Quad, ...] = ()
+    region_sum_lines: tuple[Cells, ...] = ()
+    renban: tuple[Cells, ...] = ()
+    thermo: tuple[Cells, ...] = ()
+    xv: tuple[Dot, ...] = ()
+    anticonsecutive: bool = False
+    antiking: bool = False
+    antiknight: bool = False
+    diagonal: bool = False
+    neg_kropki: bool = False
+    neg_xv: bool = False
+
+    @classmethod
+    def from_parsed(cls, parsed: dict[str, list[str] | bool]) -> "Puzzle":
+        # build a Puzzle from the clue strings returned by InputParser.parse()
+        size = parsed.get("size", 9)
+        if size != 9:
+            return cls.from_parsed_sized(parsed, size)
+
+        def cell_lists(family: str, suffix: str) -> tuple[Cells, ...]:
+            return tuple(cell_indices(x[:-len(suffix)]) for x in parsed[family])
+
+        arrows = []
+        for clue in parsed["arrow"]:
+            cells = cell_indices(clue[:-1])
+            arrows.append(Arrow(cells[0], cells[1:]))
+
+        clones = []
+        for clue in parsed["clone"]:
+            r1, r2 = clue.split("clone")
+            clones.append(Clone(cell_indices(r1), cell_indices(r2)))
+
+        quads = []
+        for clue in parsed["quadruple"]:
+            c = cell_indices(clue[:2])[0]
+            quads.append(Quad((c, c + 1, c + 9, c + 10), tuple(int(x) for x in clue[2:-1])))
+
+        return cls(
+            givens=parse_givens(parsed["givens"]),
+            arrow=tuple(arrows),
+            clone=tuple(clones),
+            entropic=cell_lists("entropic", "ent"),
+            even_odd=tuple(Parity(cell_indices(x[:-1]), x[-1] == "e")
+                           for x in parsed["even_odd"]),
+            extra_regions=cell_lists("extra_regions", "er"),
+            fortress=cell_lists("fortress", "fort"),
+            german_whispers=cell_lists("german_whispers", "gw"),
+            killer=tuple(Cage(cell_indices(region), int(total))
+                         for region, total in (x.split("k") for x in parsed["killer"])),
+            kropki=tuple(Dot(*cell_indices(x[:4]), x[4]) for x in parsed["kropki"]),
+            little_killer=tuple(Cage(cell_indices(region), int(total))
+                                for region, total in (x.split("lk") for x in parsed["little_killer"])),
+            modular_lines=cell_lists("modular_lines", "ml"),
+            palindrome=cell_lists("palindrome", "p"),
+            quadruple=tuple(quads),
+            region_sum_lines=cell_lists("region_sum_lines", "rsl"),
+            renban=cell_lists("renban", "r"),
+            thermo=cell_lists("thermo", "t"),
+            xv=tuple(Dot(*cell_indices(x[:4]), x[4]) for x in parsed["xv"]),
+            anticonsecutive=parsed["anticonsecutive"],
+            antiking=parsed["antiking"],
+            antiknight=parsed["antiknight"],
+            diagonal=parsed["diagonal"],
+            neg_kropki=parsed["neg_kropki"],
+            neg_xv=parsed["neg_xv"],
+        )
+
+    @classmethod
+    def from_parsed_sized(cls, parsed: dict[str, list[str] | bool | int], size: int) -> "Puzzle":
+        # a grid other than 9x9, which may only use the rules in SIZED_RULES
+        if size not in BOX_SHAPES:
+            raise ValueError(f"Unsupported grid size {size}, expected one of "
+                             + ", ".join(map(str, BOX_SHAPES)))
+        for name, value in parsed.items():
+            if name not in ("givens", "size") + SIZED_RULES and value:
+                raise ValueError(f"{name} is only supported on 9x9 grids")
+        return cls(givens=parse_givens(parsed["givens"], size), size=size,
+                   **{rule: parsed[rule] for rule in SIZED_RULES})
+
+    def to_dict(self) -> dict:
+        # a JSON serializable form of the puzzle, which from_dict reads back
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Puzzle":
+        def freeze(value):
+            return tuple(value) if isinstance(value, list) else value
+
+        values = {}
+        for f in fields(cls):
+            # puzzles stored before a field was added take its default
+            value = data.get(f.name, f.default)
+            if f.name in CLUE_TYPES:
+                clue_type = CLUE_TYPES[f.name]
+                value = tuple(clue_type(**{k: freeze(v) for k, v in clue.items()})
+                              for clue in value)
+            elif isinstance(value, list):
+                value = tuple(freeze(x) for x in value)
+            values[f.name] = value
+        return cls(**values)
+
+
+def as_puzzle(puzzle: Puzzle | dict[str, list[str] | bool]) -> Puzzle:
+    # engines accept either a Puzzle or the dict returned by InputParser.parse()
+    return puzzle if isinstance(puzzle, Puzzle) else Puzzle.from_parsed(puzzle)
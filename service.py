@@ -0,0 +1,283 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import init_worker
+from input_parser import InputParser, iter_puzzle_lines
+from puzzle import Puzzle
+from solution_cache import SolutionCache
+from solver import ENGINES, SolverConfig, solve_puzzle
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+
+# the time limit of a request that does not set one, and the most it may ask for
+DEFAULT_TIMEOUT = 10.0
+MAX_TIMEOUT = 60.0
+
+# time allowed on top of a request's timeout for building the model and moving
+# the puzzle to and from a worker, before the request is answered as timed out
+TIMEOUT_GRACE = 1.0
+
+# the largest request body accepted, which is far more than any puzzle needs
+MAX_BODY = 1 << 20
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+
+class ServiceBusy(Exception):
+    # raised when a new puzzle arrives while max_pending solves are already running
+    pass
+
+
+def solve_in_worker(puzzle: Puzzle, engine: str, max_seconds: float) -> str | None:
+    return solve_puzzle(puzzle, engine, config=SolverConfig(time_limit=max_seconds))
+
+
+class SolveService:
+    # solves puzzles on a pool of worker processes, as the solvers block while
+    # they build and search their models. Requests for a puzzle that is already
+    # being solved wait on that solve rather than starting another
+
+    def __init__(self, workers: int | None = None, max_pending: int | None = None,
+                 engine: str = "mip", cache_path: str | None = None) -> None:
+        self.engine = engine
+        # the workers write their model templates here, and close removes it
+        self.template_dir = tempfile.TemporaryDirectory(prefix="sudoku_")
+        self.pool = ProcessPoolExecutor(workers, initializer=init_worker,
+                                        initargs=(engine, None, self.template_dir.name))
+        # beyond this many distinct puzzles being solved or waiting for a worker,
+        # new puzzles are turned away so that the queue cannot grow without limit
+        self.max_pending = max_pending or 4 * (workers or os.cpu_count() or 1)
+        self.cache = SolutionCache(cache_path) if cache_path else None
+
+        # the solve of each puzzle in flight, and how many requests wait on each
+        self.inflight: dict[Puzzle, asyncio.Future] = {}
+        self.waiters: dict[asyncio.Future, int] = {}
+        # solves given to the pool that have not finished. A solve that every
+        # request has left is no longer in flight, but keeps its worker busy
+        # until its time limit, so this is what max_pending is checked against
+        self.running = 0
+
+    async def solve(self, puzzle: Puzzle, timeout: float = DEFAULT_TIMEOUT) -> str | None:
+        # the solution with one symbol per cell (size² characters), or None if
+        # there is no solution. Raises TimeoutError if it is not found within
+        # timeout seconds, and ServiceBusy if there are too many other puzzles
+        # to solve first
+        if self.cache is not None:
+            solution = self.cache.get(puzzle)
+            if solution is not None:
+                return solution
+
+        future = self.inflight.get(puzzle)
+        if future is None:
+            if self.running >= self.max_pending:
+                raise ServiceBusy(f"{self.running} puzzles are already being solved")
+            # the first request's timeout limits the solver's search, which any
+            # request joining it shares
+            loop = asyncio.get_running_loop()
+            work = self.pool.submit(solve_in_worker, puzzle, self.engine, timeout)
+            self.running += 1
+            # the pool calls back from its own thread once the worker is done
+            work.add_done_callback(lambda _: self.work_done(loop))
+            future = asyncio.wrap_future(work)
+            future.add_done_callback(lambda f: self.finished(puzzle, f))
+            self.inflight[puzzle] = future
+            self.waiters[future] = 0
+
+        self.waiters[future] += 1
+        try:
+            # shielded so that one request timing out or being cancelled does not
+            # cancel the solve for the others waiting on it
+            return await asyncio.wait_for(asyncio.shield(future), timeout + TIMEOUT_GRACE)
+        finally:
+            self.waiters[future] -= 1
+            if not self.waiters[future]:
+                del self.waiters[future]
+                # nobody is left waiting, so a solve still queued for a worker is
+                # dropped. One already running stops at its time limit
+                future.cancel()
+
+    def work_done(self, loop: asyncio.AbstractEventLoop) -> None:
+        def release() -> None:
+            self.running -= 1
+
+        # the loop has closed if the pool is only shut down after it
+        if not loop.is_closed():
+            loop.call_soon_threadsafe(release)
+
+    def finished(self, puzzle: Puzzle, future: asyncio.Future) -> None:
+        if self.inflight.get(puzzle) is future:
+            del self.inflight[puzzle]
+        if future.cancelled() or future.exception() is not None:
+            return
+        if self.cache is not None and future.result() is not None:
+            self.cache.put(puzzle, future.result())
+
+    def close(self) -> None:
+        try:
+            self.pool.shutdown(cancel_futures=True)
+        finally:
+            self.template_dir.cleanup()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def parse_request(body: bytes) -> tuple[Puzzle, float]:
+    # a request is a JSON object holding the puzzle text, in any form that a
+    # puzzle file may take, and optionally a timeout in seconds
+    try:
+        request = json.loads(body)
+    except ValueError:
+        raise ValueError("The request body is not valid JSON") from None
+    if not isinstance(request, dict) or not isinstance(request.get("puzzle"), str):
+        raise ValueError('The request must be a JSON object with a "puzzle" string')
+
+    timeout = request.get("timeout", DEFAULT_TIMEOUT)
+    if not isinstance(timeout, (int, float)) or timeout <= 0:
+        raise ValueError("The timeout must be a positive number of seconds")
+
+    lines = next(iter_puzzle_lines(request["puzzle"].splitlines(), "the request"), None)
+    if lines is None:
+        raise ValueError("No puzzle found in the request")
+    return InputParser("<request>", lines).parse_puzzle(), min(timeout, MAX_TIMEOUT)
+
+
+class SolveServer:
+    # a minimal HTTP/1.1 front end to a SolveService, answering POST /solve with
+    # one request per connection. It may listen on TCP or a Unix socket
+
+    def __init__(self, service: SolveService) -> None:
+        self.service = service
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            response = await self.respond(reader)
+            if response is not None:
+                status, result = response
+                body = json.dumps(result).encode()
+                head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                        "Content-Type: application/json\r\n"
+                        f"Content-Length: {len(body)}\r\n"
+                        "Connection: close\r\n")
+                if status == 503:
+                    head += "Retry-After: 1\r\n"
+                writer.write(head.encode() + b"\r\n" + body)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, reader: asyncio.StreamReader) -> tuple[int, dict] | None:
+        # the status and JSON body of the response, or None if the client has gone
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            return 413, {"solution": None, "error": "The request headers are too large"}
+
+        request_line, *header_lines = head.decode("latin-1").split("\r\n")
+        method, path, _ = (request_line.split(" ") + ["", ""])[:3]
+        if path != "/solve":
+            return 404, {"solution": None, "error": f"Unknown path {path}"}
+        if method != "POST":
+            return 405, {"solution": None, "error": "Puzzles must be sent with POST"}
+
+        headers = {}
+        for line in filter(None, header_lines):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", ""))
+        except ValueError:
+            return 400, {"solution": None, "error": "The request needs a Content-Length"}
+        if length > MAX_BODY:
+            return 413, {"solution": None, "error": "The request body is too large"}
+
+        try:
+            puzzle, timeout = parse_request(await reader.readexactly(length))
+        except ValueError as e:
+            return 400, {"solution": None, "error": str(e)}
+
+        # a client may shut down its side of the connection once the request is
+        # sent, which reads as the end of the stream, so only a reset or other
+        # error while the puzzle is solved means it has gone and the request is
+        # cancelled
+        solving = asyncio.ensure_future(self.service.solve(puzzle, timeout))
+        watching = asyncio.ensure_future(reader.read(1))
+        await asyncio.wait([solving, watching], return_when=asyncio.FIRST_COMPLETED)
+        gone = watching.done() and watching.exception() is not None
+        watching.cancel()
+        if gone and not solving.done():
+            solving.cancel()
+            return None
+
+        try:
+            solution = await solving
+        except ServiceBusy as e:
+            return 503, {"solution": None, "error": str(e)}
+        except TimeoutError:
+            return 504, {"solution": None, "error": f"No solution found within {timeout} seconds"}
+        if solution is None:
+            return 200, {"solution": None, "error": "no solution found"}
+        return 200, {"solution": solution, "error": None}
+
+
+async def serve(args: argparse.Namespace) -> None:
+    service = SolveService(args.workers, args.max_pending, args.engine, args.cache)
+    server = SolveServer(service)
+    try:
+        if args.unix:
+            listener = await asyncio.start_unix_server(server.handle, args.unix)
+            where = args.unix
+        else:
+            listener = await asyncio.start_server(server.handle, args.host, args.port)
+            where = f"http://{args.host}:{args.port}"
+        print(f"Solving puzzles posted to {where}/solve", file=sys.stderr, flush=True)
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        service.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    arg_parser = argparse.ArgumentParser(
+        description="Serve puzzle solves over HTTP from a pool of worker processes")
+    arg_parser.add_argument("--host", default=DEFAULT_HOST,
+                            help=f"address to listen on (default: {DEFAULT_HOST})")
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                            help=f"port to listen on (default: {DEFAULT_PORT})")
+    arg_parser.add_argument("--unix", metavar="PATH",
+                            help="listen on this Unix socket instead of TCP")
+    arg_parser.add_argument("-j", "--workers", type=int, default=None,
+                            help="number of worker processes (default: number of CPUs)")
+    arg_parser.add_argument("--max-pending", type=int, default=None,
+                            help="number of distinct puzzles that may be queued or solving "
+                                 "before new ones are refused (default: 4 per worker)")
+    arg_parser.add_argument("--engine", choices=ENGINES, default="mip",
+                            help="solving engine to use (default: mip)")
+    arg_parser.add_argument("--cache", metavar="PATH",
+                            help="reuse solutions stored in this sqlite file, and store new ones in it")
+    args = arg_parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+from dataclasses import fields, replace
+
+from puzzle import Puzzle, as_puzzle
+from sudoku_model import SudokuModel
+
+# Puzzle fields that switch a rule on for the whole grid. Every other field
+# besides the givens is a tuple of clues
+RULES = ("anticonsecutive", "antiking", "antiknight", "diagonal", "neg_kropki", "neg_xv")
+CLUE_FAMILIES = tuple(f.name for f in fields(Puzzle)
+                      if f.name not in ("givens", "size") and f.name not in RULES)
+
+# the negative rules apply wherever there is no clue of a family, so their rows
+# are rebuilt whenever a clue of that family is added or removed
+NEGATIVE_RULES = {"kropki": "neg_kropki", "xv": "neg_xv"}
+
+# Puzzle fields whose add_<family>_constraints method is named differently
+METHOD_NAMES = {"region_sum_lines": "region_sum_line"}
+
+EMPTY = Puzzle(givens=(0,) * 81)
+
+
+class SessionModel(SudokuModel):
+    # a model whose rows never depend on the givens, so the givens can be changed
+    # through bounds and a clue removed by deleting the rows it added. Variables
+    # that a clue rules out are fixed by a row of their own rather than a bound
+
+    def __init__(self) -> None:
+        super().__init__(EMPTY)
+
+    def fix_to_one(self, variable) -> None:
+        self += variable == 1
+
+    def fix_to_zero(self, variable) -> None:
+        self += variable == 0
+
+
+class SolveSession:
+    # a long lived model of a puzzle being edited. Clues and rules are added and
+    # removed one at a time. The model has no objective, so while the previous
+    # solution still satisfies every row and bound it is returned without solving
+    # again, and otherwise the solver is started from it
+
+    def __init__(self, puzzle: Puzzle | dict[str, list[str] | bool] | None = None) -> None:
+        self.model = SessionModel()
+        self.model.verbose = False
+        # with a warm start, generating cuts takes longer than the search they save
+        self.model.cuts = 0
+        self.puzzle = EMPTY
+        self.solution = None
+
+        # the clue each block of rows came from, as ((family, clue), row count),
+        # in the order the blocks sit in the model after the standard constraints
+        self.blocks = []
+        self.base_rows = self.model.num_rows
+        # blocks added since the last solve, which the last solution may break
+        self.unchecked = []
+        # the bounds currently set on each variable
+        self.lower = [0] * 729
+        self.upper = [1] * 729
+
+        if puzzle is not None:
+            puzzle = as_puzzle(puzzle)
+            if puzzle.size != 9:
+                raise ValueError("Editing sessions only support 9x9 grids")
+            self.puzzle = replace(EMPTY, givens=puzzle.givens)
+            for family in CLUE_FAMILIES:
+                for clue in getattr(puzzle, family):
+                    self.add_clue(family, clue)
+            for rule in RULES:
+                if getattr(puzzle, rule):
+                    self.set_rule(rule, True)
+
+    def set_given(self, cell: int, digit: int) -> None:
+        # place digit (1-9) in cell (0-80), or clear the cell if digit is 0
+        givens = list(self.puzzle.givens)
+        givens[cell] = digit
+        self.puzzle = replace(self.puzzle, givens=tuple(givens))
+
+    def add_clue(self, family: str, clue) -> None:
+        # add a clue in the form it takes in a Puzzle, e.g. a Dot to "kropki"
+        if family not in CLUE_FAMILIES:
+            raise ValueError(f"Unknown clue family {family}")
+        self.puzzle = replace(self.puzzle, **{family: getattr(self.puzzle, family) + (clue,)})
+        self.add_rows(family, clue)
+        self.refresh_negative_rule(family)
+
+    def remove_clue(self, family: str, clue) -> None:
+        if family not in CLUE_FAMILIES:
+            raise ValueError(f"Unknown clue family {family}")
+        clues = list(getattr(self.puzzle, family))
+        if clue not in clues:
+            raise ValueError(f"There is no {family} clue {clue}")
+        clues.remove(clue)
+        self.puzzle = replace(self.puzzle, **{family: tuple(clues)})
+        self.remove_rows(family, clue)
+        self.refresh_negative_rule(family)
+
+    def set_rule(self, rule: str, on: bool = True) -> None:
+        if rule not in RULES:
+            raise ValueError(f"Unknown rule {rule}")
+        if getattr(self.puzzle, rule) == on:
+            return
+        self.puzzle = replace(self.puzzle, **{rule: on})
+        if on:
+            self.add_rows(rule, True)
+        else:
+            self.remove_rows(rule, True)
+
+    def refresh_negative_rule(self, family: str) -> None:
+        rule = NEGATIVE_RULES.get(family)
+        if rule is not None and getattr(self.puzzle, rule):
+            self.remove_rows(rule, True)
+            self.add_rows(rule, True)
+
+    def add_rows(self, family: str, clue) -> None:
+        # add the rows for a single clue by building them from a puzzle holding
+        # only that clue. The negative rules also need every clue of their family
+        model = self.model
+        if family in RULES:
+            model.puzzle = replace(EMPTY, kropki=self.puzzle.kropki, xv=self.puzzle.xv,
+                                   **{family: True})
+        else:
+            model.puzzle = replace(EMPTY, **{family: (clue,)})
+        before = model.num_rows
+        model.add_family(METHOD_NAMES.get(family, family))
+        self.blocks.append(((family, clue), model.num_rows - before))
+        self.unchecked.append((family, clue))
+
+    def block_rows(self, family: str, clue) -> range:
+        # the indices of the rows a clue added
+        start = self.base_rows
+        for key, count in self.blocks:
+            if key == (family, clue):
+                return range(start, start + count)
+            start += count
+        raise ValueError(f"There are no rows for {family} clue {clue}")
+
+    def remove_rows(self, family: str, clue) -> None:
+        rows = self.block_rows(family, clue)
+        self.blocks.remove(((family, clue), len(rows)))
+        if (family, clue) in self.unchecked:
+            self.unchecked.remove((family, clue))
+        if rows:
+            self.model.remove([self.model.constrs[i] for i in rows])
+
+    def update_bounds(self) -> None:
+        # the givens, and the candidates they rule out, are set through variable
+        # bounds before each solve. The rows themselves never change with the givens
+        model = self.model
+        model.puzzle = self.puzzle
+        model.presolve()
+        eliminated = model.eliminated
+        model.eliminated = [False] * len(eliminated)
+
+        for c in range(81):
+            remaining = [v for v in range(c * 9, c * 9 + 9) if not eliminated[v]]
+            for v in range(c * 9, c * 9 + 9):
+                lower = 1 if remaining == [v] else 0
+                upper = 0 if eliminated[v] else 1
+                if lower != self.lower[v]:
+                    model.vars[v].lb = self.lower[v] = lower
+                if upper != self.upper[v]:
+                    model.vars[v].ub = self.upper[v] = upper
+
+    def still_solved(self) -> bool:
+        # whether the last solution satisfies the current bounds and every row
+        # added since it was found
+        values = [0] * 729
+        for c, d in enumerate(self.solution):
+            values[c * 9 + int(d) - 1] = 1
+        for v in range(729):
+            if values[v] > self.upper[v] or values[v] < self.lower[v]:
+                return False
+
+        constrs = self.model.constrs
+        for family, clue in self.unchecked:
+            for row in self.block_rows(family, clue):
+                expr = constrs[row].expr
+                # rows with variables of their own, such as the set chosen for a
+                # killer cage, can't be checked from the grid alone
+                if any(var.idx >= 729 for var in expr.expr):
+                    return False
+                activity = sum(coef * values[var.idx] for var, coef in expr.expr.items())
+                rhs = constrs[row].rhs
+                if (expr.sense == "<" and activity > rhs + 1e-6
+                        or expr.sense == ">" and activity < rhs - 1e-6
+                        or expr.sense == "=" and abs(activity - rhs) > 1e-6):
+                    return False
+        return True
+
+    def solve(self) -> str | None:
+        # solve the puzzle as it stands, returning the solution as an 81 character
+        # string, or None if there is no solution
+        self.update_bounds()
+        if self.solution is not None and self.still_solved():
+            self.unchecked = []
+            return self.solution
+
+        model = self.model
+        self.unchecked = []
+        if self.solution is not None:
+            model.start = [(model.cells[c][int(d) - 1], 1.0)
+                           for c, d in enumerate(self.solution)]
+        model.optimize()
+        solution = model.solution_string() or None
+        if solution is not None:
+            self.solution = solution
+        return solution
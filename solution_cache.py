@@ -0,0 +1,166 @@
+import hashlib
+import json
+import sqlite3
+import time
+from dataclasses import fields
+
+from puzzle import Puzzle
+
+DEFAULT_CACHE_PATH = "solutions.sqlite"
+
+# least recently used entries over the limit are removed once every this many
+# new entries, as finding them means scanning the whole table
+EVICT_INTERVAL = 1000
+
+# rules that are unchanged by rotating or reflecting the grid and by relabelling
+# the digits. A puzzle using no other rules is stored under the canonical form of
+# its givens, so that all of its symmetric variants share one entry
+SYMMETRIC_RULES = ("diagonal", "antiking", "antiknight")
+
+
+def grid_symmetries() -> list[tuple[int, ...]]:
+    # the 8 rotations and reflections of the grid, each as a permutation p of the
+    # cells such that the transformed grid has grid[p[c]] in cell c
+    def rotate(i: int, j: int) -> tuple[int, int]:
+        return j, 8 - i
+
+    symmetries = []
+    for transpose in [False, True]:
+        for turns in range(4):
+            perm = []
+            for i in range(9):
+                for j in range(9):
+                    i2, j2 = (j, i) if transpose else (i, j)
+                    for _ in range(turns):
+                        i2, j2 = rotate(i2, j2)
+                    perm.append(i2 * 9 + j2)
+            symmetries.append(tuple(perm))
+    return symmetries
+
+
+SYMMETRIES = grid_symmetries()
+
+
+def is_symmetric(puzzle: Puzzle) -> bool:
+    # True when the puzzle is 9x9 and the only rules used besides the givens are
+    # in SYMMETRIC_RULES
+    if puzzle.size != 9:
+        return False
+    for f in fields(Puzzle):
+        if f.name not in ("givens", "size") + SYMMETRIC_RULES and getattr(puzzle, f.name):
+            return False
+    return True
+
+
+class CacheKey:
+    # the key a puzzle is stored under, along with how to move a solution between
+    # the puzzle and the canonical form that is stored
+
+    def __init__(self, puzzle: Puzzle) -> None:
+        self.perm = None
+        self.labels = None
+
+        if not is_symmetric(puzzle):
+            data = puzzle.to_dict()
+            # 9x9 puzzles leave out their size, which keeps the keys they were
+            # stored under before other grid sizes could be solved
+            if puzzle.size == 9:
+                del data["size"]
+            text = json.dumps(data, sort_keys=True)
+            self.key = hashlib.sha256(text.encode()).hexdigest()
+            return
+
+        # under each symmetry, relabel the digits in order of first appearance and
+        # keep whichever form comes first. Equivalent puzzles reach the same form
+        best = None
+        for perm in SYMMETRIES:
+            labels = {}
+            form = tuple(labels.setdefault(puzzle.givens[p], len(labels) + 1)
+                         if puzzle.givens[p] else 0 for p in perm)
+            if best is None or form < best:
+                best, self.perm, self.labels = form, perm, labels
+
+        rules = [rule for rule in SYMMETRIC_RULES if getattr(puzzle, rule)]
+        text = "".join(map(str, best)) + ":" + ",".join(rules)
+        self.key = hashlib.sha256(text.encode()).hexdigest()
+
+    def to_canonical(self, solution: str) -> str:
+        if self.perm is None:
+            return solution
+        # digits missing from the givens take the labels left over, in order of
+        # first appearance
+        labels = dict(self.labels)
+        moved = [int(solution[p]) for p in self.perm]
+        for d in moved:
+            labels.setdefault(d, len(labels) + 1)
+        return "".join(str(labels[d]) for d in moved)
+
+    def from_canonical(self, stored: str) -> str:
+        if self.perm is None:
+            return stored
+        # digits missing from the givens can be swapped freely under these rules,
+        # so the left over labels may go to them in any order
+        digits = {label: d for d, label in self.labels.items()}
+        unused = iter(d for d in range(1, 10) if d not in self.labels)
+        for label in range(1, 10):
+            if label not in digits:
+                digits[label] = next(unused)
+
+        solution = [0] * 81
+        for c, p in enumerate(self.perm):
+            solution[p] = digits[int(stored[c])]
+        return "".join(map(str, solution))
+
+
+class SolutionCache:
+    # solutions stored on disk in sqlite, keyed by CacheKey. Once more than
+    # max_entries are stored, the least recently used are removed
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = 100_000) -> None:
+        self.max_entries = max_entries
+        self.puts = 0
+        # several worker processes may share a cache, so writers wait on each
+        # other rather than failing
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS solutions ("
+            "key TEXT PRIMARY KEY, solution TEXT NOT NULL, last_used REAL NOT NULL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS solutions_last_used ON solutions (last_used)")
+        self.connection.commit()
+
+    def get(self, puzzle: Puzzle) -> str | None:
+        # the solution of puzzle, or of any puzzle equivalent to it, if stored
+        key = CacheKey(puzzle)
+        row = self.connection.execute(
+            "SELECT solution FROM solutions WHERE key = ?", (key.key,)).fetchone()
+        if row is None:
+            return None
+        with self.connection:
+            self.connection.execute(
+                "UPDATE solutions SET last_used = ? WHERE key = ?", (time.time(), key.key))
+        return key.from_canonical(row[0])
+
+    def put(self, puzzle: Puzzle, solution: str) -> None:
+        key = CacheKey(puzzle)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)",
+                (key.key, key.to_canonical(solution), time.time()))
+        self.puts += 1
+        if self.puts % EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self) -> None:
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM solutions WHERE key IN (SELECT key FROM solutions "
+                "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM solutions").fetchone()[0]
+
+    def close(self) -> None:
+        self.evict()
+        self.connection.close()
@@ -1,9 +1,254 @@
+import time
+from dataclasses import dataclass
+
+from model_stats import ModelStats
+from puzzle import Puzzle, as_puzzle
+
+# names of the solving engines that solve_puzzle can use. "dlx" solves puzzles
+# whose rules are all regions as an exact cover problem, and hands any other
+# puzzle to "mip"
+ENGINES = ("mip", "propagation", "dlx")
+
+# the statuses a solve can end with. A timeout means the time limit passed
+# before a solution was found or the puzzle was shown to have none
+OPTIMAL = "optimal"
+FEASIBLE = "feasible"
+INFEASIBLE = "infeasible"
+TIMEOUT = "timeout"
+
+# mip's OptimizationStatus names for the statuses above. Any other status is
+# reported by its own name in lower case
+STATUS_NAMES = {
+    "OPTIMAL": OPTIMAL,
+    "FEASIBLE": FEASIBLE,
+    "INFEASIBLE": INFEASIBLE,
+    "INT_INFEASIBLE": INFEASIBLE,
+    "NO_SOLUTION_FOUND": TIMEOUT,
+}
+
+EMPHASES = ("default", "feasibility", "optimality")
+
+# the values of SolverConfig.threads that CBC can run with
+THREAD_SETTINGS = (0, -1)
+
+
+@dataclass(frozen=True, slots=True)
+class SolverConfig:
+    # settings for the mip engine, which the default values leave at CBC's own
+    # defaults
+    time_limit: float | None = None
+    # 0 lets CBC choose and -1 uses every core. A set number of threads is
+    # rejected, as the CBC build that mip bundles crashes with one
+    threads: int = 0
+    # one of EMPHASES
+    emphasis: str = "default"
+    # -1 lets CBC choose, 0 switches cuts off and 1-3 are increasingly aggressive
+    cuts: int = -1
+    # -1 lets CBC choose, 0 switches preprocessing off and 1 switches it on
+    preprocess: int = -1
+    # stop at the first solution found. The model has no objective, so any
+    # solution is optimal and there is nothing left to prove
+    feasibility_first: bool = False
+    # add redundant constraints and symmetry breaks to the model, see
+    # SudokuModel.add_strengthening_constraints
+    strengthen: bool = False
+    # run the propagation engine's constraints on a 9x9 puzzle before building
+    # the model, see propagate_puzzle
+    warm_start: bool = True
+
+    def __post_init__(self) -> None:
+        if self.emphasis not in EMPHASES:
+            raise ValueError(f"Unknown emphasis {self.emphasis}, expected one of {EMPHASES}")
+        if self.threads not in THREAD_SETTINGS:
+            raise ValueError(f"Unsupported threads {self.threads}, expected one of {THREAD_SETTINGS}")
+
+
+@dataclass(frozen=True, slots=True)
+class SolveResult:
+    status: str
+    # the solved grid with one symbol per cell, size² characters long, or None
+    # if none was found
+    solution: str | None
+    # the model's ModelStats, covering how it was built and every solve so far
+    stats: ModelStats | None = None
+
+
 class Solver:
 
-    def __init__(self, model) -> None:
+    def __init__(self, model, config: SolverConfig | None = None) -> None:
+        from mip import SearchEmphasis
+
         self.model = model
+        self.config = config or SolverConfig()
         self.model.verbose = False
+        self.model.threads = self.config.threads
+        self.model.emphasis = SearchEmphasis[self.config.emphasis.upper()]
+        self.model.cuts = self.config.cuts
+        self.model.preprocess = self.config.preprocess
+
+    def run(self, time_limit: float | None) -> str:
+        # one optimize within time_limit seconds, returning one of the statuses above
+        limits = {}
+        if time_limit is not None:
+            limits["max_seconds"] = time_limit
+        if self.config.feasibility_first:
+            limits["max_solutions"] = 1
+        start = time.perf_counter()
+        status = self.model.optimize(**limits).name
+        status = STATUS_NAMES.get(status, status.lower())
+        elapsed = time.perf_counter() - start
+        # CBC can report a model as infeasible when the time limit cuts its
+        # preprocessing short, so that is only trusted if it came in time
+        if status == INFEASIBLE and time_limit is not None and elapsed >= time_limit:
+            status = TIMEOUT
+        return status
+
+    def solve(self) -> SolveResult:
+        status = self.run(self.config.time_limit)
+        return SolveResult(status, self.solution_string() or None, self.model.stats)
+
+    def solution_string(self) -> str:
+        return self.model.solution_string()
+
+    def count_solutions(self, limit: int = 2) -> int:
+        # count solutions by excluding each one found with a no-good cut and
+        # solving again, stopping as soon as limit solutions have been found.
+        # The cuts are left in the model. The time limit covers the whole count,
+        # and TimeoutError is raised if it passes first, as a solve cut short
+        # says nothing about whether another solution exists
+        from mip import xsum
+
+        deadline = None
+        if self.config.time_limit is not None:
+            deadline = time.perf_counter() + self.config.time_limit
+        count = 0
+        while count < limit:
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                status = TIMEOUT
+            else:
+                status = self.run(remaining)
+            if status == TIMEOUT:
+                raise TimeoutError(f"Solutions not counted within {self.config.time_limit} seconds")
+            if self.model.num_solutions == 0:
+                break
+            count += 1
+            values = self.model.solution_values()
+            placed = [v for v, x in zip(self.model.vars, values) if x >= 0.99]
+            self.model += xsum(placed) <= len(placed) - 1
+        return count
+
+
+def propagate_puzzle(puzzle: Puzzle) -> list[set[int]]:
+    # the digits left in each cell once the propagation engine's constraints have
+    # run on the givens, without any search. When they contradict each other no
+    # cell is left with any digit. This takes a few milliseconds and rules out
+    # far more than the mip model's presolve can, so the model fixes those
+    # variables by their bounds. When every cell is left with one digit that is
+    # the only solution, and CBC is not needed at all. The model has no
+    # objective, so a complete MIP start would already be a solution, while a
+    # partial one would only repeat the bounds
+    from propagation_solver import PropagationSolver
+
+    solver = PropagationSolver(puzzle)
+    solver.add_constraints()
+    cands = solver.propagate_all()
+    if cands is None:
+        return [set() for _ in range(81)]
+    return [{k + 1 for k in range(9) if m >> k & 1} for m in cands[:81]]
+
+
+def warm_start(puzzle: Puzzle, config: SolverConfig | None) -> list[set[int]] | None:
+    # what propagate_puzzle knows of the puzzle, if config asks for it and the
+    # grid is one the propagation engine solves
+    if (config is not None and not config.warm_start) or puzzle.size != 9:
+        return None
+    return propagate_puzzle(puzzle)
+
+
+def solve_puzzle(puzzle: Puzzle | dict[str, list[str] | bool], engine: str = "mip",
+                 cache=None, config: SolverConfig | None = None) -> str | None:
+    # solve a puzzle parsed by InputParser with the chosen engine, returning the
+    # solution with one symbol per cell (size² characters, 81 for a 9x9 grid),
+    # or None if there is no solution. When a SolutionCache is given, a stored
+    # solution is returned without solving.
+    # config only applies to the mip engine, including puzzles the dlx engine
+    # hands on to it, and TimeoutError is raised if its time limit passes first
+    puzzle = as_puzzle(puzzle)
+    if cache is not None:
+        solution = cache.get(puzzle)
+        if solution is not None:
+            return solution
+
+    if engine == "dlx":
+        # puzzles that are not an exact cover problem are solved with mip instead
+        from dlx_solver import is_exact_cover
+        if not is_exact_cover(puzzle):
+            engine = "mip"
+
+    if engine == "dlx":
+        from dlx_solver import DancingLinksSolver
+        solution = DancingLinksSolver(puzzle).solve()
+    elif engine == "propagation":
+        from propagation_solver import PropagationSolver
+        solver = PropagationSolver(puzzle)
+        solver.add_constraints()
+        solution = solver.solve()
+    elif engine == "mip":
+        known = warm_start(puzzle, config)
+        if known is not None and not all(known):
+            solution = None
+        elif known is not None and all(len(digits) == 1 for digits in known):
+            solution = "".join(str(min(digits)) for digits in known)
+        else:
+            from sudoku_model import SudokuModel
+            model = SudokuModel(puzzle)
+            model.add_constraints(config is not None and config.strengthen, known)
+            solver = Solver(model, config)
+            result = solver.solve()
+            if result.status == TIMEOUT:
+                # the solver's config, as config itself may be None
+                raise TimeoutError(f"No solution found within {solver.config.time_limit} seconds")
+            solution = result.solution
+    else:
+        raise ValueError(f"Unknown engine {engine}, expected one of {ENGINES}")
+
+    if cache is not None and solution is not None:
+        cache.put(puzzle, solution)
+    return solution
+
+
+def count_solutions(puzzle: Puzzle | dict[str, list[str] | bool], limit: int = 2,
+                    engine: str = "mip", config: SolverConfig | None = None) -> int:
+    # count the solutions of a puzzle parsed by InputParser, up to limit. A
+    # puzzle is well posed when count_solutions(puzzle) == 1. As in
+    # solve_puzzle, TimeoutError is raised if config's time limit passes first
+    puzzle = as_puzzle(puzzle)
+    if engine == "dlx":
+        from dlx_solver import DancingLinksSolver, is_exact_cover
+        if is_exact_cover(puzzle):
+            return DancingLinksSolver(puzzle).count_solutions(limit)
+        engine = "mip"
+    if engine == "propagation":
+        from propagation_solver import PropagationSolver
+        solver = PropagationSolver(puzzle)
+        solver.add_constraints()
+        return solver.count_solutions(limit)
+
+    if engine != "mip":
+        raise ValueError(f"Unknown engine {engine}, expected one of {ENGINES}")
+
+    known = warm_start(puzzle, config)
+    if known is not None and not all(known):
+        return 0
+    if known is not None and all(len(digits) == 1 for digits in known):
+        return min(1, limit)
 
-    def solve(self) -> None:
-        self.model.optimize()
-        return self.model.sol
+    from sudoku_model import SudokuModel
+    model = SudokuModel(puzzle)
+    model.add_constraints(known=known)
+    # symmetry breaking would cut off solutions, so only the strengthening rows
+    # are added, through add_family so that they are counted in the model's stats
+    if config is not None and config.strengthen:
+        model.add_family("strengthening")
+    return Solver(model, config).count_solutions(limit)
@@ -1,219 +1,510 @@
-from mip import BINARY, Model, xsum
+import atexit
+import os
+import tempfile
+import time
+from dataclasses import fields
+
+from mip import BINARY, CBC, Model, OptimizationStatus, xsum
+
+from digit_sets import can_fill, sum_combinations
+from grid import SYMBOLS, get_grid
+from model_stats import ModelStats
+from puzzle import CONSTRAINT_FAMILIES, Cells, Puzzle
+
+# LP file holding the variables and standard constraints that are the same for
+# every 9x9 puzzle. It is written once per process, then read into each new model
+_base_model_path = None
+
+
+def base_model_path(directory: str | None = None) -> str:
+    # the file is written to directory, which whoever made it has to remove.
+    # Without one it goes in the system's temporary directory and is removed
+    # when the process exits. atexit does not run in pool workers, so pools
+    # pass a directory that their parent removes instead
+    global _base_model_path
+    if _base_model_path is None:
+        fd, path = tempfile.mkstemp(prefix="sudoku_base_", suffix=".lp", dir=directory)
+        os.close(fd)
+        if directory is None:
+            atexit.register(os.remove, path)
+
+        base = SudokuModel(None, from_template=False)
+        base.add_standard_constraints()
+        base.write(path)
+        _base_model_path = path
+    return _base_model_path
+
+
+# whether the CBC functions behind search_counts have been declared to cffi
+_search_counts_declared = False
+
+
+def search_counts(model: Model) -> tuple[int, int]:
+    # the branch and bound nodes and simplex iterations of the last CBC solve.
+    # mip does not declare these functions, so they are added to its cffi
+    # definitions the first time they are needed
+    global _search_counts_declared
+    from mip.cbc import cbclib, ffi
+
+    if not _search_counts_declared:
+        ffi.cdef("int Cbc_getNodeCount(Cbc_Model *model);"
+                 "int Cbc_getIterationCount(Cbc_Model *model);")
+        _search_counts_declared = True
+    return (cbclib.Cbc_getNodeCount(model.solver._model),
+            cbclib.Cbc_getIterationCount(model.solver._model))
+
+
+# Puzzle fields that treat every digit alike, so that swapping two digits
+# throughout a solution gives another solution. Killer cages also do when they
+# have no total
+RELABELLING_FIELDS = ("clone", "extra_regions", "palindrome", "antiking", "antiknight", "diagonal")
+
+
+def interchangeable_digits(puzzle: Puzzle) -> list[int]:
+    # the digits (0 to size - 1) missing from the givens when no rule tells digits apart.
+    # Any solution can then be relabelled to order these digits however we like
+    for f in fields(Puzzle):
+        value = getattr(puzzle, f.name)
+        if f.name in ("givens", "size") + RELABELLING_FIELDS or not value:
+            continue
+        if f.name == "killer" and all(cage.total == 0 for cage in value):
+            continue
+        return []
+    used = {d - 1 for d in puzzle.givens if d}
+    return [k for k in range(puzzle.size) if k not in used]
 
 
 class SudokuModel(Model):
 
-    def __init__(self, input: dict[str: list[str]]) -> None:
-        super().__init__()
-        self.input = input
+    # the families add_constraints adds, in order
+    constraint_families = CONSTRAINT_FAMILIES
+
+    def __init__(self, puzzle: Puzzle | None, from_template: bool = True, size: int = 9) -> None:
+        # naming CBC stops mip from first searching the system for a Gurobi
+        # library, which takes far longer than loading CBC itself
+        super().__init__(solver_name=CBC)
+        self.puzzle = puzzle
+        self.stats = ModelStats()
+        self.grid = get_grid(puzzle.size if puzzle is not None else size)
+        n = self.grid.size
+        # nothing is ruled out until presolve runs
+        self.eliminated = [False] * n ** 3
+
+        # only 9x9 grids have a template. Other sizes add their standard
+        # constraints with the puzzle's constraints, once presolve has shown
+        # which variables they can leave out
+        self.from_template = from_template and n == 9
+        if self.from_template:
+            # reading the prebuilt base model is much quicker than adding the
+            # 729 variables and 324 standard constraints one at a time
+            self.read(base_model_path())
+        else:
+            self.add_cell_variables()
 
         # define sol, the solution 3D boolean matrix where correct value is given
-        # by the index (+1) where k == 1
-        self.sol = [[[self.add_var(var_type=BINARY) for i in range(9)]
-                     for j in range(9)] for k in range(9)]
-
-    def add_standard_constraints(self):
-        # exactly 1 value per cell
-        for i in range(9):
-            for j in range(9):
-                self += xsum(self.sol[i][j][k] for k in range(9)) == 1
-
-        # numbers 1-9 in each row
-        for i in range(9):
-            for k in range(9):
-                self += xsum(self.sol[i][j][k] for j in range(9)) == 1
+        # by the index (+1) where k == 1. Variable i * n * n + j * n + k is
+        # sol[i][j][k]
+        variables = iter(self.vars)
+        self.sol = [[[next(variables) for k in range(n)]
+                     for j in range(n)] for i in range(n)]
+        # the variables of each cell by its index, as cells are given in a Puzzle
+        self.cells = [cell for row in self.sol for cell in row]
+
+    def add_cell_variables(self) -> None:
+        # a binary variable for each digit of each cell. A 25x25 grid has 15,625
+        # of them, so with CBC they are passed straight to the solver rather
+        # than added one at a time through add_var
+        count = self.grid.size ** 3
+        if self.solver_name.upper() != "CBC":
+            for _ in range(count):
+                self.add_var(var_type=BINARY)
+            return
 
-        # numbers 1-9 in each column
-        for j in range(9):
-            for k in range(9):
-                self += xsum(self.sol[i][j][k] for i in range(9)) == 1
+        from mip.cbc import cbclib, ffi
+        model = self.solver._model
+        for v in range(count):
+            cbclib.Cbc_addCol(model, f"x({v})".encode(), 0.0, 1.0, 0.0, b"\x01", 0, ffi.NULL, ffi.NULL)
+        # let the model know about the columns added behind its back
+        self.vars.update_vars(count)
+
+    def solution_values(self) -> list[float]:
+        # the value of the cell variables in the last solution found, in the
+        # order of sol. With CBC these are copied out in a single call rather
+        # than looked up one variable at a time
+        count = self.grid.size ** 3
+        if self.solver_name.upper() == "CBC":
+            from mip.cbc import cbclib, ffi
+            return ffi.unpack(cbclib.Cbc_getColSolution(self.solver._model), count)
+        return [v.x for v in self.vars[:count]]
+
+    def solution_string(self) -> str:
+        # the solved grid as a string of one symbol per cell, row by row, which
+        # is empty if the model has not been solved
+        if self.num_solutions == 0:
+            return ""
+        n = self.grid.size
+        return "".join([SYMBOLS[v % n] for v, x in enumerate(self.solution_values())
+                        if x >= 0.99])
+
+    def add_standard_constraints(self) -> None:
+        # exactly one digit in each cell, and each digit exactly once in each
+        # row, column and box. Variables presolve has ruled out are left out
+        n = self.grid.size
+        rows = [list(range(c * n, c * n + n)) for c in range(self.grid.cells)]
+        rows += [[c * n + k for c in house] for house in self.grid.houses for k in range(n)]
+        self.add_partition_rows(rows)
+
+    def presolve(self, known: list[set[int]] | None = None) -> None:
+        # work out which candidates the givens rule out before any constraint is
+        # added, so that those variables can be fixed by their bounds and left out
+        # of the constraints that follow. eliminated[v.idx] is True when variable v
+        # is known to be 0. known holds the digits (1 to size) still possible in
+        # each cell, when another engine has already ruled some out
+        puzzle = self.puzzle
+        grid = self.grid
+        n = grid.size
+        candidates = [set(range(n)) for c in range(grid.cells)]
+        if known is not None:
+            candidates = [{d - 1 for d in digits} for digits in known]
+
+        for clue in puzzle.even_odd:
+            allowed = {1, 3, 5, 7} if clue.even else {0, 2, 4, 6, 8}
+            for c in clue.cells:
+                candidates[c] &= allowed
+
+        # groups of cells that may not contain the same digit twice
+        groups = list(grid.houses)
+        if puzzle.diagonal:
+            groups += grid.diagonals
+        groups += puzzle.extra_regions
+        groups += [x.cells for x in puzzle.killer]
+        groups += puzzle.renban
+
+        peers = [set() for c in range(grid.cells)]
+        for group in groups:
+            for c in group:
+                peers[c].update(group)
+
+        pairs = ()
+        if puzzle.antiking:
+            pairs += grid.king_pairs
+        if puzzle.antiknight:
+            pairs += grid.knight_pairs
+        for a, b in pairs:
+            peers[a].add(b)
+            peers[b].add(a)
+
+        # cells holding a single digit, whose digit is removed from their peers.
+        # Any peer left with a single candidate is placed in turn
+        queue = []
+        for c, given in enumerate(puzzle.givens):
+            if given:
+                candidates[c] &= {given - 1}
+            if len(candidates[c]) == 1:
+                queue.append(c)
+
+        orthogonal = [[] for c in range(grid.cells)]
+        for a, b in grid.orthogonal_pairs:
+            orthogonal[a].append(b)
+            orthogonal[b].append(a)
+
+        placed = set()
+        while queue:
+            while queue:
+                c = queue.pop()
+                if c in placed or len(candidates[c]) != 1:
+                    continue
+                placed.add(c)
+                k = next(iter(candidates[c]))
+
+                removals = [(peer, k) for peer in peers[c] if peer != c]
+                if puzzle.anticonsecutive:
+                    for adjacent in orthogonal[c]:
+                        removals += [(adjacent, k - 1), (adjacent, k + 1)]
+
+                for c2, k2 in removals:
+                    if k2 in candidates[c2]:
+                        candidates[c2].discard(k2)
+                        if len(candidates[c2]) == 1:
+                            queue.append(c2)
+
+            # a digit left with one place in a house goes there, which may
+            # place more cells in turn
+            for house in grid.houses:
+                for k in range(n):
+                    places = [c for c in house if k in candidates[c]]
+                    if len(places) == 1 and len(candidates[places[0]]) > 1:
+                        candidates[places[0]] = {k}
+                        queue.append(places[0])
+
+        self.eliminated = [k not in candidates[c] for c in range(grid.cells) for k in range(n)]
+
+    def fix_to_one(self, variable) -> None:
+        variable.lb = 1
+
+    def fix_to_zero(self, variable) -> None:
+        variable.ub = 0
+        self.eliminated[variable.idx] = True
+
+    def add_at_most_one(self, variables: list) -> None:
+        # variables fixed to 0 are left out, and if at most one variable is left
+        # the constraint can't be broken so is not added
+        variables = [v for v in variables if not self.eliminated[v.idx]]
+        if len(variables) > 1:
+            self += xsum(variables) <= 1
+
+    def add_exactly_one(self, variables: list) -> None:
+        remaining = [v for v in variables if not self.eliminated[v.idx]]
+        if len(remaining) == 1:
+            self.fix_to_one(remaining[0])
+        else:
+            # when no variable remains the puzzle has no solution, so the full
+            # constraint is kept for the solver to report as infeasible
+            self += xsum(remaining or variables) == 1
+
+    def add_packing_rows(self, rows: list[list[int]]) -> None:
+        # add sum(variables) <= 1 for each list of variable indices in rows
+        self.add_unit_rows(rows, "<")
+
+    def add_partition_rows(self, rows: list[list[int]]) -> None:
+        # add sum(variables) == 1 for each list of variable indices in rows, in
+        # the same way as add_exactly_one
+        kept = []
+        for row in rows:
+            remaining = [v for v in row if not self.eliminated[v]]
+            if len(remaining) == 1:
+                self.fix_to_one(self.vars[remaining[0]])
+            else:
+                kept.append(remaining or row)
+        self.add_unit_rows(kept, "=")
+
+    def add_unit_rows(self, rows: list[list[int]], sense: str) -> None:
+        # add a row summing each list of variable indices in rows, which is "<"
+        # or "=" to 1. With CBC the rows are passed straight to the solver,
+        # skipping the LinExpr and Constr objects that adding each row through
+        # xsum would build
+        if not rows:
+            return
+        if self.solver_name.upper() != "CBC":
+            for row in rows:
+                expr = xsum(self.vars[v] for v in row)
+                self += expr <= 1 if sense == "<" else expr == 1
+            return
 
-        # numbers 1-9 in each 3x3 region
-        for i2 in range(3):
-            for j2 in range(3):
-                for k in range(9):
-                    self += xsum(self.sol[i][j][k]
-                                 for i in range(i2 * 3, i2 * 3 + 3)
-                                 for j in range(j2 * 3, j2 * 3 + 3)
-                                 ) == 1
+        from mip.cbc import cbclib, ffi
+        model = self.solver._model
+        ones = ffi.new("double[]", [1.0] * max(len(row) for row in rows))
+        cbc_sense = b"L" if sense == "<" else b"E"
+        for row in rows:
+            cbclib.Cbc_addRow(model, b"", len(row), row, ones, cbc_sense, 1.0)
+        # let the model know about the rows added behind its back
+        self.constrs.update_constrs(self.solver.num_rows())
+
+    def add_pair_exclusions(self, cell1: list, cell2: list,
+                            forbidden: set[tuple[int, int]]) -> None:
+        # the digit pairs (a, b) in forbidden may not be placed in cell1 and cell2
+        # together. Rather than one row per pair, each digit a of cell1 gets a
+        # single row over all its partners, which is equivalent as cell2 holds
+        # exactly one digit. Either
+        #   cell1[a] + sum(cell2[b] for forbidden b) <= 1, or
+        #   cell1[a] <= sum(cell2[b] for allowed b)
+        # is used, whichever has fewer terms
+        for a in range(1, 10):
+            if self.eliminated[cell1[a - 1].idx]:
+                continue
+            allowed = [cell2[b - 1] for b in range(1, 10)
+                       if (a, b) not in forbidden and not self.eliminated[cell2[b - 1].idx]]
+            excluded = [cell2[b - 1] for b in range(1, 10)
+                        if (a, b) in forbidden and not self.eliminated[cell2[b - 1].idx]]
+            if not excluded:
+                continue
+            if not allowed:
+                # no digit in cell2 can go with a, so a is ruled out of cell1
+                self.fix_to_zero(cell1[a - 1])
+            elif len(excluded) <= len(allowed):
+                self += cell1[a - 1] + xsum(excluded) <= 1
+            else:
+                self += cell1[a - 1] <= xsum(allowed)
 
     def add_given_constraints(self) -> None:
-        for i in range(9):
-            for j in range(9):
-                char = self.input["givens"][i][j]
-                if char != ".":
-                    self += self.sol[i][j][int(char) - 1] == 1
+        # givens, and every candidate the presolve ruled out, are fixed through
+        # variable bounds rather than added as constraints
+        for cell in self.cells:
+            remaining = [v for v in cell if not self.eliminated[v.idx]]
+            for v in cell:
+                if self.eliminated[v.idx]:
+                    v.ub = 0
+            if len(remaining) == 1:
+                remaining[0].lb = 1
+
+    def candidates(self, c: int) -> set[int]:
+        # the digits (1 to size) not yet ruled out of cell c
+        n = self.grid.size
+        return {k + 1 for k in range(n) if not self.eliminated[c * n + k]}
+
+    def add_digit_set_constraints(self, cells: Cells, sets: tuple[frozenset[int], ...],
+                                  circle: int | None = None) -> None:
+        # the cells hold different digits, which together make up one of sets. If
+        # circle is given, the digit in that cell is the total of the set.
+        # Sets the candidates left in the cells cannot fill are dropped, and any
+        # candidate in no remaining set is fixed to 0
+        candidates = [self.candidates(c) for c in cells]
+        totals = self.candidates(circle) if circle is not None else None
+        sets = [s for s in sets if (totals is None or sum(s) in totals) and can_fill(candidates, s)]
+
+        possible = set().union(*sets)
+        for c, cell in zip(cells, candidates):
+            for d in cell - possible:
+                self.fix_to_zero(self.cells[c][d - 1])
+        if circle is not None:
+            for d in totals - {sum(s) for s in sets}:
+                self.fix_to_zero(self.cells[circle][d - 1])
+        if not sets:
+            return
 
-    def add_arrow_constraints(self) -> None:
-        arrow = self.input["arrow"]
-        if not arrow:
+        if len(sets) == 1:
+            for d in sets[0]:
+                self.add_exactly_one([self.cells[c][d - 1] for c in cells])
             return
 
-        for clue in arrow:
-            circle = (int(clue[0]), int(clue[1]))
-            others = [(int(clue[2*i]), int(clue[2*i+1]))
-                      for i in range(1, len(clue[2:-1]) // 2 + 1)]
+        # a variable for each set, exactly one of which is chosen. Each digit then
+        # appears in the cells once if it is in the chosen set and not at all
+        # otherwise, which is much tighter than the sum alone
+        chosen = [self.add_var(var_type=BINARY) for _ in sets]
+        self += xsum(chosen) == 1
+        for d in possible:
+            self += xsum(self.cells[c][d - 1] for c in cells) \
+                == xsum(x for x, s in zip(chosen, sets) if d in s)
+        if circle is not None:
+            for total in {sum(s) for s in sets}:
+                self += self.cells[circle][total - 1] \
+                    == xsum(x for x, s in zip(chosen, sets) if sum(s) == total)
 
-            # sum of all digits in others equals digit in circle
-            self += xsum(xsum((k + 1) * self.sol[x[0] - 1][x[1] - 1][k] for x in others) for k in range(
-                9)) == xsum((k+1) * self.sol[circle[0] - 1][circle[1] - 1][k] for k in range(9))
+    def add_arrow_constraints(self) -> None:
+        for clue in self.puzzle.arrow:
+            shaft = clue.shaft
+            if all(self.grid.share_house(a, b) for i, a in enumerate(shaft) for b in shaft[i + 1:]):
+                # the shaft digits are all different, so they are one of the sets
+                # of distinct digits summing to a digit the circle can take
+                sets = tuple(s for total in range(1, 10)
+                             for s in sum_combinations(len(shaft), total))
+                self.add_digit_set_constraints(shaft, sets, clue.circle)
+                continue
+
+            # each shaft digit is at most the largest circle digit less the
+            # smallest digits of the rest of the shaft, and the circle is at least
+            # the sum of the smallest shaft digits
+            lowest = {c: min(self.candidates(c), default=0) for c in shaft}
+            floor = sum(lowest.values())
+            for k in range(floor - 1):
+                if not self.eliminated[self.cells[clue.circle][k].idx]:
+                    self.fix_to_zero(self.cells[clue.circle][k])
+            ceiling = max(self.candidates(clue.circle), default=0)
+            for c in shaft:
+                for d in self.candidates(c):
+                    if d > ceiling - floor + lowest[c]:
+                        self.fix_to_zero(self.cells[c][d - 1])
+
+            # sum of all digits along the shaft equals digit in circle
+            self += xsum(xsum((k + 1) * self.cells[c][k] for c in shaft) for k in range(
+                9)) == xsum((k+1) * self.cells[clue.circle][k] for k in range(9))
 
     def add_clone_constraints(self) -> None:
-        clone = self.input["clone"]
-        if not clone:
-            return
-        for clue in clone:
-            r1, r2 = clue.split("clone")
-            cells1 = [(int(r1[2*i]), int(r1[2*i+1]))
-                      for i in range(len(r1) // 2)]
-            cells2 = [(int(r2[2*i]), int(r2[2*i+1]))
-                      for i in range(len(r2) // 2)]
-            for i in range(len(cells1)):
-                c1 = self.sol[cells1[i][0] - 1][cells1[i][1] - 1]
-                c2 = self.sol[cells2[i][0] - 1][cells2[i][1] - 1]
+        for clue in self.puzzle.clone:
+            for a, b in zip(clue.cells, clue.copy):
+                c1 = self.cells[a]
+                c2 = self.cells[b]
                 for k in range(9):
                     self += c1[k] == c2[k]
 
     def add_entropic_constraints(self) -> None:
-        entropic = self.input["entropic"]
-        if not entropic:
-            return
-        for clue in entropic:
-            clue = clue[:-3]
-            cells = [(int(clue[2*i]), int(clue[2*i+1]))
-                     for i in range(len(clue) // 2)]
-
+        for cells in self.puzzle.entropic:
             if len(cells) == 2:
-                cell1 = self.sol[cells[0][0] - 1][cells[0][1] - 1]
-                cell2 = self.sol[cells[1][0] - 1][cells[1][1] - 1]
+                cell1 = self.cells[cells[0]]
+                cell2 = self.cells[cells[1]]
 
-                self += xsum(x[k] for k in [0, 1, 2]
-                             for x in [cell1, cell2]) <= 1
+                self.add_at_most_one([x[k] for k in [0, 1, 2]
+                                      for x in [cell1, cell2]])
 
-                self += xsum(x[k] for k in [3, 4, 5]
-                             for x in [cell1, cell2]) <= 1
+                self.add_at_most_one([x[k] for k in [3, 4, 5]
+                                      for x in [cell1, cell2]])
 
-                self += xsum(x[k] for k in [6, 7, 8]
-                             for x in [cell1, cell2]) <= 1
+                self.add_at_most_one([x[k] for k in [6, 7, 8]
+                                      for x in [cell1, cell2]])
             else:
                 for i in range(len(cells) - 2):
-                    cell1 = self.sol[cells[i][0] - 1][cells[i][1] - 1]
-                    cell2 = self.sol[cells[i + 1][0] - 1][cells[i + 1][1] - 1]
-                    cell3 = self.sol[cells[i + 2][0] - 1][cells[i + 2][1] - 1]
+                    cell1 = self.cells[cells[i]]
+                    cell2 = self.cells[cells[i + 1]]
+                    cell3 = self.cells[cells[i + 2]]
 
-                    self += xsum(x[k] for k in [0, 1, 2]
-                                 for x in [cell1, cell2, cell3]) == 1
+                    self.add_exactly_one([x[k] for k in [0, 1, 2]
+                                          for x in [cell1, cell2, cell3]])
 
-                    self += xsum(x[k] for k in [3, 4, 5]
-                                 for x in [cell1, cell2, cell3]) == 1
+                    self.add_exactly_one([x[k] for k in [3, 4, 5]
+                                          for x in [cell1, cell2, cell3]])
 
-                    self += xsum(x[k] for k in [6, 7, 8]
-                                 for x in [cell1, cell2, cell3]) == 1
+                    self.add_exactly_one([x[k] for k in [6, 7, 8]
+                                          for x in [cell1, cell2, cell3]])
 
     def add_even_odd_constraints(self) -> None:
-        even_odd = self.input["even_odd"]
-        if not even_odd:
-            return
-        for clue in even_odd:
-            cells, oe = [(int(clue[2*i]), int(clue[2*i+1]))
-                         for i in range(len(clue) // 2)], clue[-1]
-
-            if oe == "e":
-                for cell in cells:
-                    sol_cell = self.sol[cell[0]-1][cell[1]-1]
+        for clue in self.puzzle.even_odd:
+            if clue.even:
+                for c in clue.cells:
                     # index 1,3,5,7 == value 2,4,6,8
-                    self += xsum(sol_cell[k] for k in [1, 3, 5, 7]) == 1
-            if oe == "o":
-                for cell in cells:
-                    sol_cell = self.sol[cell[0]-1][cell[1]-1]
+                    self.add_exactly_one([self.cells[c][k] for k in [1, 3, 5, 7]])
+            else:
+                for c in clue.cells:
                     # index 0,2,4,6,8 == value 1,3,5,7,9
-                    self += xsum(sol_cell[k] for k in [0, 2, 4, 6, 8]) == 1
+                    self.add_exactly_one([self.cells[c][k] for k in [0, 2, 4, 6, 8]])
 
     def add_extra_regions_constraints(self) -> None:
-        extra_regions = self.input["extra_regions"]
-        if not extra_regions:
-            return
-
-        for region in extra_regions:
-            region_cells = [(int(region[2*i]), int(region[2*i+1]))
-                            for i in range((len(region) - 2) // 2)]
-
+        for region in self.puzzle.extra_regions:
             for k in range(9):
-                self += xsum(self.sol[x[0] - 1][x[1] - 1][k]
-                             for x in region_cells) == 1
+                self.add_exactly_one([self.cells[c][k] for c in region])
 
     def add_fortress_constraints(self) -> None:
-        fortress = self.input["fortress"]
-        if not fortress:
-            return
-
         orthog_adjacent = [(-1, 0), (0, -1), (0, 1), (1, 0)]
-        for clue in fortress:
-            cells = [(int(clue[2*i]), int(clue[2*i+1]))
-                     for i in range((len(clue) - 4) // 2)]
-            for cell in cells:
-                print(cell)
-                cell_val = xsum((k + 1) * self.sol[cell[0] - 1]
-                                [cell[1] - 1][k] for k in range(9))
-                for adj in orthog_adjacent:
-                    new = (cell[0] + adj[0], cell[1] + adj[1])
+        for cells in self.puzzle.fortress:
+            for c in cells:
+                i, j = divmod(c, 9)
+                cell_val = xsum((k + 1) * self.cells[c][k] for k in range(9))
+                for di, dj in orthog_adjacent:
+                    new = (i + di) * 9 + j + dj
                     # ignore any other fortresses, as well as any cells out of bounds
-                    if new in cells or new[0] not in list(range(1, 10)) or new[1] not in list(range(1, 10)):
+                    if not (0 <= i + di < 9 and 0 <= j + dj < 9) or new in cells:
                         continue
-                    print(f"Trying to say {cell} > {new}")
-
-                    new_val = xsum((k + 1) * self.sol[new[0] - 1]
-                                   [new[1] - 1][k] for k in range(9))
+                    new_val = xsum((k + 1) * self.cells[new][k] for k in range(9))
                     self += cell_val - new_val >= 1
 
     def add_german_whispers_constraints(self) -> None:
-        german_whispers = self.input["german_whispers"]
-        if not german_whispers:
-            return
-
         all_pairs = [(x+1, y+1) for x in range(9) for y in range(9)]
 
         valid_pairs = [(x+1, y+1) for x in range(9)
                        for y in range(9) if abs(x-y) >= 5]
 
-        for clue in german_whispers:
-            cells = [(int(clue[2*i]), int(clue[2*i+1]))
-                     for i in range((len(clue) - 2) // 2)]
+        for cells in self.puzzle.german_whispers:
             # take off 1 because looking ahead along the german whisper line
             for i in range(len(cells) - 1):
-                cell1 = self.sol[cells[i][0] - 1][cells[i][1] - 1]
-                cell2 = self.sol[cells[i + 1][0] - 1][cells[i + 1][1] - 1]
+                cell1 = self.cells[cells[i]]
+                cell2 = self.cells[cells[i + 1]]
 
-                # iterate through invalid pairs for a german whisper
-                # only a maximum of one of the values in these pairs may correspond to the true value
-                for pair in set(all_pairs) - set(valid_pairs):
-                    self += cell1[pair[0] - 1] + cell2[pair[1] - 1] <= 1
+                # invalid pairs for a german whisper may not both be placed
+                self.add_pair_exclusions(cell1, cell2, set(all_pairs) - set(valid_pairs))
 
     def add_killer_constraints(self) -> None:
-        killer = self.input["killer"]
-        if not killer:
-            return
-
-        for clue in killer:
-            region, s = clue.split("k")
-            region_cells = [(int(region[2*i]), int(region[2*i+1]))
-                            for i in range(len(region) // 2)]
+        for cage in self.puzzle.killer:
+            # the digits of a cage with a total are one of the sets of that many
+            # distinct digits with that sum, which also keeps them from repeating
+            if cage.total != 0:
+                self.add_digit_set_constraints(
+                    cage.cells, sum_combinations(len(cage.cells), cage.total))
+                continue
 
             # digits cannot repeat in region cells
             for k in range(9):
-                self += xsum(self.sol[x[0] - 1][x[1] - 1][k]
-                             for x in region_cells) <= 1
-
-            # if a sum is given, ensure region cells add to that sum. Otherwise, continue
-            if int(s) != 0:
-                self += xsum(xsum((k + 1) * self.sol[x[0] - 1][x[1] - 1][k]
-                             for x in region_cells) for k in range(9)) == int(s)
+                self.add_at_most_one([self.cells[c][k] for c in cage.cells])
 
     def add_kropki_constraints(self) -> None:
-        kropki = self.input["kropki"]
-        if not kropki:
-            return
-
         # all tuples (a, b) where a,b are in 1-9
         all_pairs = [(x+1, y+1) for x in range(9) for y in range(9)]
 
@@ -224,164 +515,123 @@ class SudokuModel(Model):
         poss_w = [(i+1, j+1) for i in range(9)
                   for j in range(9) if abs(i-j) == 1]
 
-        for rule in kropki:
-            # rule must always be 4 digits + b/w, as dictated by InputParser
-            cell1 = self.sol[int(rule[0]) - 1][int(rule[1]) - 1]
-            cell2 = self.sol[int(rule[2]) - 1][int(rule[3]) - 1]
-            colour = rule[4]
+        for dot in self.puzzle.kropki:
+            cell1 = self.cells[dot.a]
+            cell2 = self.cells[dot.b]
+            colour = dot.kind
 
             if colour == "w":
-                for pair in set(all_pairs) - set(poss_w):
-                    self += cell1[pair[0] - 1] + cell2[pair[1] - 1] <= 1
+                self.add_pair_exclusions(cell1, cell2, set(all_pairs) - set(poss_w))
 
             if colour == "b":
-                for pair in set(all_pairs) - set(poss_b):
-                    self += cell1[pair[0] - 1] + cell2[pair[1] - 1] <= 1
+                self.add_pair_exclusions(cell1, cell2, set(all_pairs) - set(poss_b))
 
     def add_little_killer_constraints(self) -> None:
-        little_killer = self.input["little_killer"]
-        if not little_killer:
-            return
-
-        for clue in little_killer:
-            region, s = clue.split("lk")
-            region_cells = [(int(region[2*i]), int(region[2*i+1]))
-                            for i in range(len(region) // 2)]
-
-            self += xsum(xsum((k + 1) * self.sol[x[0] - 1][x[1] - 1][k]
-                              for x in region_cells) for k in range(9)) == int(s)
+        for clue in self.puzzle.little_killer:
+            self += xsum(xsum((k + 1) * self.cells[c][k]
+                              for c in clue.cells) for k in range(9)) == clue.total
 
     def add_modular_lines_constraints(self) -> None:
-        modular_lines = self.input["modular_lines"]
-        if not modular_lines:
-            return
-        for clue in modular_lines:
-            clue = clue[:-2]
-            cells = [(int(clue[2*i]), int(clue[2*i+1]))
-                     for i in range(len(clue) // 2)]
-
+        for cells in self.puzzle.modular_lines:
             if len(cells) == 2:
-                cell1 = self.sol[cells[i][0] - 1][cells[i][1] - 1]
-                cell2 = self.sol[cells[i + 1][0] - 1][cells[i + 1][1] - 1]
+                cell1 = self.cells[cells[0]]
+                cell2 = self.cells[cells[1]]
 
-                self += xsum(x[k] for k in [0, 3, 6]
-                             for x in [cell1, cell2]) <= 1
+                self.add_at_most_one([x[k] for k in [0, 3, 6]
+                                      for x in [cell1, cell2]])
 
-                self += xsum(x[k] for k in [1, 4, 7]
-                             for x in [cell1, cell2]) <= 1
+                self.add_at_most_one([x[k] for k in [1, 4, 7]
+                                      for x in [cell1, cell2]])
 
-                self += xsum(x[k] for k in [2, 5, 8]
-                             for x in [cell1, cell2]) <= 1
+                self.add_at_most_one([x[k] for k in [2, 5, 8]
+                                      for x in [cell1, cell2]])
 
             else:
                 for i in range(len(cells) - 2):
-                    cell1 = self.sol[cells[i][0] - 1][cells[i][1] - 1]
-                    cell2 = self.sol[cells[i + 1][0] - 1][cells[i + 1][1] - 1]
-                    cell3 = self.sol[cells[i + 2][0] - 1][cells[i + 2][1] - 1]
+                    cell1 = self.cells[cells[i]]
+                    cell2 = self.cells[cells[i + 1]]
+                    cell3 = self.cells[cells[i + 2]]
 
-                    self += xsum(x[k] for k in [0, 3, 6]
-                                 for x in [cell1, cell2, cell3]) == 1
+                    self.add_exactly_one([x[k] for k in [0, 3, 6]
+                                          for x in [cell1, cell2, cell3]])
 
-                    self += xsum(x[k] for k in [1, 4, 7]
-                                 for x in [cell1, cell2, cell3]) == 1
+                    self.add_exactly_one([x[k] for k in [1, 4, 7]
+                                          for x in [cell1, cell2, cell3]])
 
-                    self += xsum(x[k] for k in [2, 5, 8]
-                                 for x in [cell1, cell2, cell3]) == 1
+                    self.add_exactly_one([x[k] for k in [2, 5, 8]
+                                          for x in [cell1, cell2, cell3]])
 
     def add_palindrome_constraints(self) -> None:
-        palindrome = self.input["palindrome"]
-        if not palindrome:
-            return
-        for clue in palindrome:
-            cells = [(int(clue[2*i]), int(clue[2*i+1]))
-                     for i in range(len(clue) // 2)]
+        for cells in self.puzzle.palindrome:
             for i in range(len(cells) // 2):
                 # take the ith and (n-i)th cells from the list of cells
-                cell1 = self.sol[cells[i][0] - 1][cells[i][1] - 1]
-                cell2 = self.sol[cells[-i-1][0] - 1][cells[-i-1][1] - 1]
+                cell1 = self.cells[cells[i]]
+                cell2 = self.cells[cells[-i-1]]
                 # set them equal to each other
                 for k in range(9):
                     self += cell1[k] == cell2[k]
 
     def add_quadruple_constraints(self) -> None:
-        quadruple = self.input["quadruple"]
-        if not quadruple:
-            return
-
-        for q in quadruple:
-            row = int(q[0])
-            col = int(q[1])
-            cells = [(row, col), (row, col + 1),
-                     (row + 1, col), (row + 1, col + 1)]
-            digits = [int(x) for x in q[2:-1]]
-            for d in set(digits):
-                self += xsum(self.sol[x[0] - 1][x[1] - 1][d - 1]
-                             for x in cells) == digits.count(d)
+        for q in self.puzzle.quadruple:
+            for d in set(q.digits):
+                self += xsum(self.cells[c][d - 1] for c in q.cells) == q.digits.count(d)
 
     def add_region_sum_line_constraints(self) -> None:
-        region_sum_line = self.input["region_sum_lines"]
-        if not region_sum_line:
-            return
-
-        for clue in region_sum_line:
-            cells = [(int(clue[2*i]), int(clue[2*i+1]))
-                     for i in range((len(clue) - 3) // 2)]
-
+        for cells in self.puzzle.region_sum_lines:
             # separate groups of cells into each distinct region
             separated = [[cells[0]]]
-            for i in range(len(cells) - 1):
-                c1 = cells[i]
-                c2 = cells[i + 1]
-
-                # check c1 and c2 are in the same 3x3 region
-                if (c1[0] - 1) // 3 == (c2[0] - 1) // 3 and (c1[1] - 1) // 3 == (c2[1] - 1) // 3:
+            for c1, c2 in zip(cells, cells[1:]):
+                if self.grid.box_of(c1) == self.grid.box_of(c2):
                     separated[-1].append(c2)
                 else:
                     separated.append([c2])
+            if len(separated) < 2:
+                continue
 
-            # set all regions to have the same sum
-            # this turns out faster than just setting the sum of region1 to be equal to region 2, 2 to 3, etc.
+            # the digits of a segment are different as it lies in one box, so
+            # each segment is one of the sets of distinct digits its cells can
+            # fill, with a sum every other segment can also make
+            options = []
             for a in separated:
-                for b in separated:
-                    if a != b:
-                        sum_a = xsum(xsum(
-                            (k + 1) * self.sol[x[0] - 1][x[1] - 1][k] for k in range(9)) for x in a)
-
-                        sum_b = xsum(xsum((k + 1) * self.sol[x[0] - 1][x[1] - 1][k]
-                                          for k in range(9)) for x in b)
-
-                        self += sum_a == sum_b
+                candidates = [self.candidates(c) for c in a]
+                options.append([s for total in range(1, 46)
+                                for s in sum_combinations(len(a), total)
+                                if can_fill(candidates, s)])
+            totals = set.intersection(*({sum(s) for s in sets} for sets in options))
+
+            # a variable for each total, exactly one of which is chosen and which
+            # each segment then matches with a set of that sum, in the same way
+            # as add_digit_set_constraints does for a single set of cells. That
+            # takes rows in proportion to the number of segments, rather than
+            # to the number of pairs of them, and is much tighter than asking
+            # the segment sums to be equal
+            chosen_total = {total: self.add_var(var_type=BINARY) for total in totals}
+            self += xsum(chosen_total.values()) == 1
+            for a, sets in zip(separated, options):
+                sets = [s for s in sets if sum(s) in totals]
+                possible = set().union(*sets)
+                for c in a:
+                    for d in self.candidates(c) - possible:
+                        self.fix_to_zero(self.cells[c][d - 1])
+
+                chosen = [self.add_var(var_type=BINARY) for _ in sets]
+                for d in possible:
+                    self += xsum(self.cells[c][d - 1] for c in a) \
+                        == xsum(x for x, s in zip(chosen, sets) if d in s)
+                for total, x_total in chosen_total.items():
+                    self += xsum(x for x, s in zip(chosen, sets) if sum(s) == total) == x_total
 
     def add_renban_constraints(self) -> None:
-        renban = self.input["renban"]
-        if not renban:
-            return
-
-        for clue in renban:
-            cells = [(int(clue[2*i]), int(clue[2*i+1]))
-                     for i in range(len(clue) // 2)]
-
-            # ensure that all pairs of cells in the renban group
-            # have a maximum difference of num cells - 1
-            for c1 in cells:
-                for c2 in cells:
-                    v1 = xsum(
-                        (k + 1) * self.sol[c1[0] - 1][c1[1] - 1][k] for k in range(9))
-                    v2 = xsum(
-                        (k + 1) * self.sol[c2[0] - 1][c2[1] - 1][k] for k in range(9))
-                    self += v1 - v2 <= len(cells) - 1
-                    self += v2 - v1 <= len(cells) - 1
-
-            # ensure that no digit is repeated in the renban group
-            for k in range(9):
-                self += xsum(self.sol[c[0] - 1][c[1] - 1][k]
-                             for c in cells) <= 1
+        for cells in self.puzzle.renban:
+            # the cells hold different digits that make up a run of consecutive
+            # digits, one of the 10 - len(cells) runs of that length. Choosing
+            # a run takes a row for each digit, where bounding the difference
+            # of every pair of cells took two rows for each pair
+            runs = tuple(frozenset(range(low, low + len(cells)))
+                         for low in range(1, 11 - len(cells)))
+            self.add_digit_set_constraints(cells, runs)
 
     def add_thermo_constraints(self) -> None:
-        thermo = self.input["thermo"]
-        if not thermo:
-            return
-
         # all tuples (a, b) where a,b are in 1-9
         all_pairs = set([(x+1, y+1) for x in range(9) for y in range(9)])
 
@@ -390,125 +640,90 @@ class SudokuModel(Model):
         valid_pairs = set([(i, i+j) for i in range(1, 10)
                           for j in range(1, 10-i)])
 
-        for clue in thermo:
-            cells = [(int(clue[2*i]), int(clue[2*i+1]))
-                     for i in range(len(clue) // 2)]
-
+        for cells in self.puzzle.thermo:
             for i in range(len(cells) - 1):
-                cell1 = self.sol[cells[i][0] - 1][cells[i][1] - 1]
-                cell2 = self.sol[cells[i + 1][0] - 1][cells[i + 1][1] - 1]
-                # iterate over invalid pairs for consecutive, increasing cells in a thermo
-                # only a maximum of one of the values in these pairs may correspond to the true value
-                for pair in all_pairs - valid_pairs:
-                    self += cell1[pair[0] - 1] + cell2[pair[1] - 1] <= 1
+                cell1 = self.cells[cells[i]]
+                cell2 = self.cells[cells[i + 1]]
+                # invalid pairs for consecutive, increasing cells in a thermo may not both be placed
+                self.add_pair_exclusions(cell1, cell2, all_pairs - valid_pairs)
 
     def add_xv_constraints(self) -> None:
-        xv = self.input["xv"]
-        if not xv:
-            return
         all_pairs = [(x+1, y+1) for x in range(9) for y in range(9)]
         poss_v = [(i+1, j+1) for i in range(9)
                   for j in range(9) if i + j + 2 == 5]
         poss_x = [(i+1, j+1) for i in range(9)
                   for j in range(9) if i + j + 2 == 10]
 
-        for rule in xv:
-            # rule must always be 4 digits + b/w, as dictated by InputParser
-            cell1 = self.sol[int(rule[0]) - 1][int(rule[1]) - 1]
-            cell2 = self.sol[int(rule[2]) - 1][int(rule[3]) - 1]
-            colour = rule[4]
+        for mark in self.puzzle.xv:
+            cell1 = self.cells[mark.a]
+            cell2 = self.cells[mark.b]
+            colour = mark.kind
 
             if colour == "v":
-                for pair in set(all_pairs) - set(poss_v):
-                    self += cell1[pair[0] - 1] + cell2[pair[1] - 1] <= 1
+                self.add_pair_exclusions(cell1, cell2, set(all_pairs) - set(poss_v))
 
             if colour == "x":
-                for pair in set(all_pairs) - set(poss_x):
-                    self += cell1[pair[0] - 1] + cell2[pair[1] - 1] <= 1
+                self.add_pair_exclusions(cell1, cell2, set(all_pairs) - set(poss_x))
 
     def add_anticonsecutive_constraints(self) -> None:
         # no cells containing consecutive digits orthogonally adjacent to each other
-        if not self.input["anticonsecutive"]:
+        if not self.puzzle.anticonsecutive:
             return
 
-        orthog_adjacent = [(-1, 0), (0, -1), (0, 1), (1, 0)]
-        for i in range(9):
-            for j in range(9):
-                for adj in orthog_adjacent:
-                    # ignore adjacencies where it would go out of bounds
-                    if i + adj[0] not in list(range(9)) or j + adj[1] not in list(range(9)):
-                        continue
-                    for k in range(9):
-                        # for cell values (k) in 1-8, the cell value (k+1) in 2-9
-                        # can't be in the adjacent cell given by adj
-                        if k < 8:
-                            self += self.sol[i][j][k] + \
-                                self.sol[i + adj[0]][j + adj[1]][k + 1] <= 1
-
-                        # for cell values (k) in 2-9, the cell value (k-1) in 1-8
-                        # can't be in the adjacent cell given by adj
-                        if k > 0:
-                            self += self.sol[i][j][k] + \
-                                self.sol[i + adj[0]][j + adj[1]][k - 1] <= 1
+        # the digit k in cell a rules out k - 1 and k + 1 in cell b, which is one
+        # row as b can only hold one of them. Every pair of digits that can't go
+        # together is covered by the row for the digit in a
+        eliminated = self.eliminated
+        n = self.grid.size
+        rows = []
+        for a, b in self.grid.orthogonal_pairs:
+            for k in range(n):
+                if eliminated[a * n + k]:
+                    continue
+                row = [a * n + k] + [b * n + k2 for k2 in (k - 1, k + 1)
+                                     if 0 <= k2 < n and not eliminated[b * n + k2]]
+                if len(row) > 1:
+                    rows.append(row)
+        self.add_packing_rows(rows)
 
     def add_antiking_constraints(self) -> None:
         # no orthogonally or diagonally adjacent cells may contain the same digit
-        if not self.input["antiking"]:
+        if not self.puzzle.antiking:
             return
-
-        # can ignore orthogonally adjacent cells as they will be ruled out my normal sudoku rules
-        diag_adjacent = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
-        for i in range(9):
-            for j in range(9):
-                # ignore adjacencies where it would go out of bounds
-                for move in diag_adjacent:
-                    if i + move[0] not in list(range(9)) or j + move[1] not in list(range(9)):
-                        continue
-                    else:
-                        for k in range(9):
-                            self += self.sol[i][j][k] + \
-                                self.sol[i + move[0]][j + move[1]][k] <= 1
+        self.add_neighbour_constraints(self.grid.king_pairs)
 
     def add_antiknight_constraints(self) -> None:
         # no cells that are a knight's move away from each other in chess may contain the same digit
-        if not self.input["antiknight"]:
+        if not self.puzzle.antiknight:
             return
+        self.add_neighbour_constraints(self.grid.knight_pairs)
 
-        # offsets from a particular cell that denote which cells are a single knight's move away
-        knight_adjacent = [(-2, -1), (-2, 1), (-1, -2), (-1, 2),
-                           (1, -2), (1, 2), (2, -1), (2, 1)]
-        for i in range(9):
-            for j in range(9):
-                for move in knight_adjacent:
-                    # ignore adjacencies where it would go out of bounds
-                    if i + move[0] not in list(range(9)) or j + move[1] not in list(range(9)):
-                        continue
-                    else:
-                        for k in range(9):
-                            self += self.sol[i][j][k] + \
-                                self.sol[i + move[0]][j + move[1]][k] <= 1
+    def add_neighbour_constraints(self, pairs: tuple[tuple[int, int], ...]) -> None:
+        # the cells in each pair may not contain the same digit
+        eliminated = self.eliminated
+        n = self.grid.size
+        self.add_packing_rows([[a * n + k, b * n + k] for a, b in pairs for k in range(n)
+                               if not eliminated[a * n + k] and not eliminated[b * n + k]])
 
     def add_diagonal_constraints(self) -> None:
-        # numbers 1-9 in both long diagonals
-        if not self.input["diagonal"]:
+        # each digit once in both long diagonals
+        if not self.puzzle.diagonal:
             return
-        for k in range(9):
-            self += xsum(self.sol[i][i][k] for i in range(9)) == 1
-            self += xsum(self.sol[i][8 - i][k] for i in range(9)) == 1
+        n = self.grid.size
+        self.add_partition_rows([[c * n + k for c in diagonal]
+                                 for diagonal in self.grid.diagonals for k in range(n)])
 
     def add_neg_kropki_constraints(self) -> None:
-        neg_kropki = self.input["neg_kropki"]
-        if not neg_kropki:
+        if not self.puzzle.neg_kropki:
             return
 
         # need to find all intersections without any kropki dot
-        kropki_intersections = [((int(x[0]), int(x[1])), (int(x[2]), int(x[3])))
-                                for x in self.input["kropki"]]
+        kropki_intersections = {(x.a, x.b) for x in self.puzzle.kropki}
 
-        all_intersections = [((i, j), (i+1, j)) for i in range(1, 9) for j in range(
-            1, 10)] + [((i, j), (i, j+1)) for i in range(1, 10) for j in range(1, 9)]
+        all_intersections = [(i * 9 + j, (i + 1) * 9 + j) for i in range(8) for j in range(
+            9)] + [(i * 9 + j, i * 9 + j + 1) for i in range(9) for j in range(8)]
 
-        bare_intersections = set(all_intersections) - set(kropki_intersections)
+        bare_intersections = [x for x in all_intersections if x not in kropki_intersections]
 
         # possible pairs of cell values for black dots (quotient of 2)
         poss_b = [(i+1, j+1) for i in range(9)
@@ -518,26 +733,23 @@ class SudokuModel(Model):
                   for j in range(9) if abs(i-j) == 1]
 
         for inter in bare_intersections:
-            cell1 = self.sol[inter[0][0] - 1][inter[0][1] - 1]
-            cell2 = self.sol[inter[1][0] - 1][inter[1][1] - 1]
-            for poss in poss_b + poss_w:
-                # in the valid pairs for black+white kropki dots, a maximum of
-                # 1 of the values must be true in the intersection
-                self += cell1[poss[0] - 1] + cell2[poss[1] - 1] <= 1
+            cell1 = self.cells[inter[0]]
+            cell2 = self.cells[inter[1]]
+            # the valid pairs for black+white kropki dots may not be placed
+            # either side of the intersection
+            self.add_pair_exclusions(cell1, cell2, set(poss_b + poss_w))
 
     def add_neg_xv_constraints(self) -> None:
-        neg_xv = self.input["neg_xv"]
-        if not neg_xv:
+        if not self.puzzle.neg_xv:
             return
 
         # need to find all intersections without any X or V
-        xv_intersections = [((int(x[0]), int(x[1])), (int(x[2]), int(x[3])))
-                            for x in self.input["xv"]]
+        xv_intersections = {(x.a, x.b) for x in self.puzzle.xv}
 
-        all_intersections = [((i, j), (i+1, j)) for i in range(1, 9) for j in range(
-            1, 10)] + [((i, j), (i, j+1)) for i in range(1, 10) for j in range(1, 9)]
+        all_intersections = [(i * 9 + j, (i + 1) * 9 + j) for i in range(8) for j in range(
+            9)] + [(i * 9 + j, i * 9 + j + 1) for i in range(9) for j in range(8)]
 
-        bare_intersections = set(all_intersections) - set(xv_intersections)
+        bare_intersections = [x for x in all_intersections if x not in xv_intersections]
 
         # possible pairs of cell values for V
         poss_v = [(i+1, j+1) for i in range(9)
@@ -547,37 +759,75 @@ class SudokuModel(Model):
                   for j in range(9) if i + j + 2 == 10]
 
         for inter in bare_intersections:
-            cell1 = self.sol[inter[0][0] - 1][inter[0][1] - 1]
-            cell2 = self.sol[inter[1][0] - 1][inter[1][1] - 1]
-            for poss in poss_v + poss_x:
-                # in the valid pairs for V + X, a maximum of
-                # 1 of the values must be true in the intersection
-                self += cell1[poss[0] - 1] + cell2[poss[1] - 1] <= 1
-
-    def add_constraints(self):
-        self.add_standard_constraints()
-        self.add_given_constraints()
-        self.add_arrow_constraints()
-        self.add_clone_constraints()
-        self.add_entropic_constraints()
-        self.add_even_odd_constraints()
-        self.add_extra_regions_constraints()
-        self.add_fortress_constraints()
-        self.add_german_whispers_constraints()
-        self.add_killer_constraints()
-        self.add_kropki_constraints()
-        self.add_little_killer_constraints()
-        self.add_modular_lines_constraints()
-        self.add_palindrome_constraints()
-        self.add_quadruple_constraints()
-        self.add_region_sum_line_constraints()
-        self.add_renban_constraints()
-        self.add_thermo_constraints()
-        self.add_xv_constraints()
-
-        self.add_anticonsecutive_constraints()
-        self.add_antiking_constraints()
-        self.add_antiknight_constraints()
-        self.add_diagonal_constraints()
-        self.add_neg_kropki_constraints()
-        self.add_neg_xv_constraints()
+            cell1 = self.cells[inter[0]]
+            cell2 = self.cells[inter[1]]
+            # the valid pairs for V + X may not be placed either side of the intersection
+            self.add_pair_exclusions(cell1, cell2, set(poss_v + poss_x))
+
+    def add_symmetry_breaking_constraints(self) -> None:
+        # interchangeable digits must first appear in the top row in increasing
+        # order, which leaves one solution out of each set of relabellings
+        digits = interchangeable_digits(self.puzzle)
+        positions = [xsum(j * self.cells[j][k] for j in range(self.grid.size)) for k in digits]
+        for a, b in zip(positions, positions[1:]):
+            self += a + 1 <= b
+
+    def add_innie_outie_constraints(self) -> None:
+        # the 45 rule. Where killer cages lie wholly inside a house, the rest of
+        # the house sums to 45 less their totals, and where cages cover a house,
+        # the cells they have outside it sum to their totals less 45
+        cages = [cage for cage in self.puzzle.killer if cage.total != 0]
+        for house in self.grid.houses:
+            cells = set(house)
+            inside = [cage for cage in cages if cells.issuperset(cage.cells)]
+            rest = cells.difference(*(cage.cells for cage in inside))
+            if inside and rest:
+                self += xsum((k + 1) * self.cells[c][k] for c in rest for k in range(9)) \
+                    == 45 - sum(cage.total for cage in inside)
+
+            touching = [cage for cage in cages if cells.intersection(cage.cells)]
+            covered = set().union(*(cage.cells for cage in touching))
+            outside = covered - cells
+            if touching and outside and covered >= cells:
+                self += xsum((k + 1) * self.cells[c][k] for c in outside for k in range(9)) \
+                    == sum(cage.total for cage in touching) - 45
+
+    def add_strengthening_constraints(self) -> None:
+        # constraints that no solution breaks but that cut off fractional parts of
+        # the search, so that CBC explores fewer nodes
+        self.add_innie_outie_constraints()
+
+    def add_family(self, family: str) -> None:
+        # add a family of constraints with add_<family>_constraints, recording the
+        # time it took and the rows and nonzeros it added in self.stats
+        rows, nonzeros = self.num_rows, self.num_nz
+        start = time.perf_counter()
+        getattr(self, f"add_{family}_constraints")()
+        self.stats.record_family(family, time.perf_counter() - start,
+                                 self.num_rows - rows, self.num_nz - nonzeros)
+
+    def add_constraints(self, strengthen: bool = False, known: list[set[int]] | None = None):
+        # strengthening also breaks symmetry, which keeps one solution of each set
+        # of relabellings, so it is only for finding a solution, not counting them.
+        # known is passed on to presolve
+        start = time.perf_counter()
+        self.presolve(known)
+        self.stats.record_family("presolve", time.perf_counter() - start, 0, 0)
+        if not self.from_template:
+            self.add_family("standard")
+        for family in self.constraint_families:
+            self.add_family(family)
+        if strengthen:
+            self.add_family("strengthening")
+            self.add_family("symmetry_breaking")
+
+    def optimize(self, *args, **kwargs):
+        # every solve is added to self.stats, however the model is solved
+        start = time.perf_counter()
+        status = super().optimize(*args, **kwargs)
+        # CBC only starts a branch and bound search once the LP relaxation is
+        # feasible, and has no counts to give before then
+        counts = (0, 0) if status in (OptimizationStatus.INFEASIBLE, OptimizationStatus.ERROR) \
+            else search_counts(self)
+        self.stats.record_solve(time.perf_counter() - start, *counts)
+        return status